@@ -0,0 +1,137 @@
+from datetime import datetime, timedelta
+
+
+def amount_of(record):
+    try:
+        return int(record["金額"])
+    except (TypeError, ValueError):
+        try:
+            return int(float(record["金額"]))
+        except (TypeError, ValueError):
+            return 0
+
+
+def parse_date(date_str):
+    return datetime.strptime(str(date_str), "%Y-%m-%d").date()
+
+
+def week_range(any_day):
+    # 以週一為一週的開始
+    start = any_day - timedelta(days=any_day.weekday())
+    return start, start + timedelta(days=6)
+
+
+class _Bucket:
+    # 某一天或某個月的小計：總金額、筆數，以及各項目的 [金額, 筆數]
+    __slots__ = ("total", "count", "items")
+
+    def __init__(self):
+        self.total = 0
+        self.count = 0
+        self.items = {}
+
+    def add(self, item, amount, sign):
+        self.total += sign * amount
+        self.count += sign
+        entry = self.items.setdefault(item, [0, 0])
+        entry[0] += sign * amount
+        entry[1] += sign
+        if entry[1] <= 0:
+            del self.items[item]
+
+
+class Aggregates:
+    # 每日、每月的累計金額，隨新增、修改、刪除即時增減，
+    # 統計時只需要合併少數幾個 bucket，不必重新掃描整本帳
+    def __init__(self):
+        self.days = {}
+        self.months = {}
+
+    def clear(self):
+        self.days = {}
+        self.months = {}
+
+    def _apply(self, record, sign):
+        day = str(record["日期"])
+        item = str(record["項目"])
+        amount = amount_of(record)
+        for table, key in ((self.days, day), (self.months, day[:7])):
+            bucket = table.get(key)
+            if bucket is None:
+                bucket = table[key] = _Bucket()
+            bucket.add(item, amount, sign)
+            if bucket.count <= 0:
+                del table[key]
+
+    def add(self, record):
+        self._apply(record, 1)
+
+    def remove(self, record):
+        self._apply(record, -1)
+
+    @staticmethod
+    def _merge(buckets):
+        # 回傳 (總金額, {項目: 金額})；沒有任何資料時回傳 None
+        buckets = [b for b in buckets if b is not None]
+        if not buckets:
+            return None
+        total = 0
+        per_item = {}
+        for b in buckets:
+            total += b.total
+            for name, (amount, _) in b.items.items():
+                per_item[name] = per_item.get(name, 0) + amount
+        return total, per_item
+
+    def day(self, date_str):
+        return self._merge([self.days.get(date_str)])
+
+    def month(self, month_str):
+        return self._merge([self.months.get(month_str)])
+
+    def daily(self, month_str):
+        # 某月每一天的總金額 {日期: 金額}，沒有紀錄的日子不列出
+        first = datetime.strptime(month_str, "%Y-%m").date()
+        result = {}
+        d = first
+        while d.month == first.month:
+            bucket = self.days.get(d.strftime("%Y-%m-%d"))
+            if bucket is not None:
+                result[d.strftime("%Y-%m-%d")] = bucket.total
+            d += timedelta(days=1)
+        return result
+
+    def version(self, month_str):
+        # 由該月的內容（各項目金額、每天金額）組成，TTL 重新載入後內容沒變，版本也不變
+        bucket = self.months.get(month_str)
+        items = tuple(sorted((name, amount) for name, (amount, _) in bucket.items.items())) if bucket else ()
+        return items, tuple(self.daily(month_str).items())
+
+    def span(self, start, end):
+        # start、end 為 date（含頭尾）；整月的部分直接用月份 bucket
+        if start > end:
+            start, end = end, start
+        buckets = []
+        d = start
+        while d <= end:
+            if d.day == 1:
+                next_month = (d.replace(day=28) + timedelta(days=4)).replace(day=1)
+                if next_month - timedelta(days=1) <= end:
+                    buckets.append(self.months.get(d.strftime("%Y-%m")))
+                    d = next_month
+                    continue
+            buckets.append(self.days.get(d.strftime("%Y-%m-%d")))
+            d += timedelta(days=1)
+        return self._merge(buckets)
+
+    def week(self, any_day):
+        return self.span(*week_range(any_day))
+
+    def quarter(self, year, q):
+        months = [f"{year:04d}-{m:02d}" for m in range(3 * q - 2, 3 * q + 1)]
+        return self._merge([self.months.get(m) for m in months])
+
+    def year(self, year):
+        months = [f"{year:04d}-{m:02d}" for m in range(1, 13)]
+        return self._merge([self.months.get(m) for m in months])
+
@@ -0,0 +1,77 @@
+"""LINE 送訊息效能測試：對本機 mock server 比較有無連線池、以及注入錯誤時重試的效果。
+
+    python benchmarks/bench_messaging.py
+    python benchmarks/bench_messaging.py --messages 2000 --threads 16 --latency-ms 20
+"""
+import argparse
+import os
+import sys
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from linebot import LineBotApi  # noqa: E402
+from linebot.http_client import RequestsHttpClient  # noqa: E402
+from linebot.models import TextSendMessage  # noqa: E402
+
+from messaging import Messenger, PooledHttpClient  # noqa: E402
+from mock_line_server import MockLineServer  # noqa: E402
+
+
+def fake_event(i):
+    return types.SimpleNamespace(
+        reply_token=f"token-{i}",
+        timestamp=time.time() * 1000,
+        source=types.SimpleNamespace(user_id=f"U{i % 50}", group_id=None, room_id=None),
+    )
+
+
+def run(label, server, http_client, messages, threads):
+    api = LineBotApi("bench-token", endpoint=server.endpoint, http_client=http_client)
+    messenger = Messenger(api, backoff=0.01)
+    server.requests.clear()
+    server.connections = 0
+    latencies = []
+
+    def send(i):
+        start = time.perf_counter()
+        try:
+            messenger.reply(fake_event(i), TextSendMessage(text="✅ 記帳成功"))
+        except Exception:
+            pass
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(send, range(messages)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    print(
+        f"{label:<28} {messages / elapsed:8.1f} msg/s  "
+        f"p50={latencies[len(latencies) // 2] * 1000:6.1f} ms  "
+        f"p99={latencies[int(len(latencies) * 0.99) - 1] * 1000:6.1f} ms  "
+        f"connections={server.connections:<5} {messenger.stats()}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    server = MockLineServer(latency_ms=args.latency_ms, seed=1).start()
+    run("requests (no pool)", server, RequestsHttpClient, args.messages, args.threads)
+    run("PooledHttpClient", server, PooledHttpClient, args.messages, args.threads)
+
+    server.rate_limit, server.server_error, server.expired_token = 0.05, 0.02, 0.05
+    run("pooled + 429/5xx/expired", server, PooledHttpClient, args.messages, args.threads)
+    print(f"mock server responses: {dict(sorted(server.requests.items()))}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
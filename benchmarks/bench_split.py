@@ -0,0 +1,82 @@
+"""分帳引擎效能測試：隨機產生大型群組與大量分帳紀錄，量測餘額更新與結算的時間。
+
+    python benchmarks/bench_split.py
+    python benchmarks/bench_split.py --members 500 --expenses 20000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from split import Balances, format_split_note, parse_shares  # noqa: E402
+
+
+def synthetic_records(members, expenses, seed):
+    rng = random.Random(seed)
+    names = [f"m{i}" for i in range(members)]
+    records = []
+    for _ in range(expenses):
+        amount = rng.randint(50, 5000)
+        group = rng.sample(names, rng.randint(2, min(12, members)))
+        mode = rng.random()
+        if mode < 0.6:
+            specs = group
+        elif mode < 0.9:
+            specs = [f"{name}*{rng.randint(1, 4)}" for name in group]
+        else:
+            cuts = sorted(rng.sample(range(1, amount), len(group) - 1))
+            values = [b - a for a, b in zip([0, *cuts], [*cuts, amount])]
+            specs = [f"{name}={value}" for name, value in zip(group, values)]
+        shares = parse_shares(amount, specs)
+        payer = rng.choice(group)
+        records.append({"日期": "2025-05-01", "項目": "bench", "金額": amount, "備註": format_split_note(payer, shares)})
+    return records
+
+
+def run(members, expenses, seed):
+    records = synthetic_records(members, expenses, seed)
+    balances = Balances()
+
+    start = time.perf_counter()
+    for r in records:
+        balances.add(r)
+    add_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    transfers = balances.settle()
+    settle_time = time.perf_counter() - start
+
+    # 驗證：照著轉帳後每個人的餘額都歸零
+    net = dict(balances.net)
+    for debtor, creditor, value in transfers:
+        net[debtor] += value
+        net[creditor] -= value
+    assert all(v == 0 for v in net.values()), "結算後仍有餘額"
+    assert sum(balances.net.values()) == 0
+    nonzero = len(balances.net)
+    assert len(transfers) <= max(nonzero - 1, 0)
+
+    print(
+        f"members={members:>5} expenses={expenses:>6} "
+        f"add={add_time * 1e6 / expenses:7.2f} us/筆 "
+        f"settle={settle_time * 1000:7.2f} ms "
+        f"transfers={len(transfers):>5} (上限 {max(nonzero - 1, 0)})"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, nargs="*", default=[10, 100, 500, 1000])
+    parser.add_argument("--expenses", type=int, nargs="*", default=[1000, 10000])
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    for members in args.members:
+        for expenses in args.expenses:
+            run(members, expenses, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""冷啟動測試：import 時間，以及有無啟動預熱時第一個 webhook 事件的延遲。
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --connect-latency-ms 1500 --sheets-latency-ms 300 --ledger-size 20000
+
+連線延遲模擬 OAuth 授權加上以名稱開啟試算表的時間。
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SECRET = "bench-channel-secret"
+USER_ID = "Ubenchstartup"
+os.environ["LINE_CHANNEL_SECRET"] = SECRET
+os.environ.setdefault("LINE_CHANNEL_ACCESS_TOKEN", "bench-token")
+os.environ["LEDGER_BACKEND"] = "sheets"
+# 事件記到 sheet1 的預設帳本，也就是預熱的對象
+os.environ["LEGACY_LEDGER_ID"] = USER_ID
+
+from fakes import FakeLineBotApi, FakeSpreadsheet, signed_webhook, text_event  # noqa: E402
+
+
+def measure_import(runs):
+    # 每次都在新的 process 中 import，量到的才是冷啟動
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", code], cwd=ROOT, env=os.environ, capture_output=True, text=True, check=True
+        )
+        samples.append(float(out.stdout.strip().splitlines()[-1]))
+    return samples
+
+
+def reset(bot, args):
+    from ledgers import LedgerRegistry
+    from messaging import Messenger
+    from sheets_client import LazySpreadsheet
+    from storage import build_storage
+
+    today = date.today()
+
+    def connect():
+        time.sleep(args.connect_latency_ms / 1000)
+        sheets = FakeSpreadsheet(bot.SHEET_HEADERS, args.sheets_latency_ms)
+        sheets.sheet1.seed(
+            [(today - timedelta(days=i % 365)).isoformat(), "早餐", 80, ""] for i in range(args.ledger_size)
+        )
+        return sheets
+
+    bot.spreadsheet = LazySpreadsheet(connect)
+    bot.messenger = Messenger(FakeLineBotApi(args.line_latency_ms))
+    bot.ledgers = LedgerRegistry(lambda ledger_id: build_storage(bot.open_worksheet, ledger_id))
+    bot.startup.update(warm_ms=None, warmed=[], error=None)
+
+
+def first_event(bot):
+    body, signature = signed_webhook(SECRET, [text_event(f"查詢 {date.today():%Y%m%d}", USER_ID)])
+    start = time.perf_counter()
+    for event in bot.handler.parser.parse(body, signature):
+        bot.dispatch_event(event)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--import-runs", type=int, default=5)
+    parser.add_argument("--connect-latency-ms", type=float, default=800)
+    parser.add_argument("--sheets-latency-ms", type=float, default=200)
+    parser.add_argument("--line-latency-ms", type=float, default=20)
+    parser.add_argument("--ledger-size", type=int, default=5000)
+    parser.add_argument("--first-event-after-ms", type=float, default=3000, help="啟動後多久收到第一個事件")
+    args = parser.parse_args()
+
+    samples = measure_import(args.import_runs)
+    print(f"import main          median={statistics.median(samples) * 1000:7.1f} ms  max={max(samples) * 1000:7.1f} ms")
+
+    import main as bot
+
+    reset(bot, args)
+    print(f"first event (cold)   {first_event(bot) * 1000:7.1f} ms")
+
+    reset(bot, args)
+    start = time.perf_counter()
+    bot.start_warm_up()
+    print(f"startup hook         {(time.perf_counter() - start) * 1000:7.1f} ms (預熱在背景進行)")
+    time.sleep(args.first_event_after_ms / 1000)
+    latency = first_event(bot)
+    print(f"first event (warmed) {latency * 1000:7.1f} ms  warm-up={bot.startup}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""整個 bot 的離線壓測：假 Google Sheet 與假 LINE API（可注入延遲），送出帶簽章的 webhook。
+
+    python benchmarks/bench_webhook.py
+    python benchmarks/bench_webhook.py --events 5000 --users 50 --threads 16 --sheets-latency-ms 80 --line-latency-ms 30
+    python benchmarks/bench_webhook.py --scenario stats --ledger-size 100000
+
+每個情境回報吞吐量、單一事件 p50/p99 延遲，以及平均每個事件呼叫 Sheets／LINE API 的次數。
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SECRET = "bench-channel-secret"
+os.environ["LINE_CHANNEL_SECRET"] = SECRET
+os.environ.setdefault("LINE_CHANNEL_ACCESS_TOKEN", "bench-token")
+
+from fakes import FakeLineBotApi, FakeSpreadsheet, signed_webhook, text_event  # noqa: E402
+
+ITEMS = ["早餐", "午餐", "晚餐", "咖啡", "飲料", "交通", "停車", "日用品", "電影", "宵夜"]
+SCENARIOS = ("add", "query", "stats", "concurrent")
+
+
+def setup(bot, args):
+    # 換上假的試算表與 LINE API，帳本從空的重新開始
+    from ledgers import LedgerRegistry
+    from messaging import Messenger
+    from storage import build_storage
+
+    sheets = FakeSpreadsheet(bot.SHEET_HEADERS, args.sheets_latency_ms, args.sheets_read_latency_ms)
+    line = FakeLineBotApi(args.line_latency_ms)
+    bot.spreadsheet.set(sheets)
+    bot.messenger = Messenger(line, backoff=0.01)
+    bot.ledgers = LedgerRegistry(lambda ledger_id: build_storage(bot.open_worksheet, ledger_id))
+    return sheets, line
+
+
+def seed_group_ledger(bot, group_id, size, today, rng):
+    rows = [
+        [(today - timedelta(days=rng.randrange(365))).isoformat(), rng.choice(ITEMS), rng.randint(20, 2000), ""]
+        for _ in range(size)
+    ]
+    rows.sort(key=lambda r: r[0])
+    book = bot.ledgers.get(group_id)
+    for i in range(0, len(rows), 5000):
+        book.storage.append(rows[i:i + 5000])
+    # 先載入快取，量的是穩定狀態而不是冷啟動
+    book.cache.records()
+
+
+def flush_storages(bot):
+    # sqlite+sheets 的試算表寫入在背景佇列裡，先等寫完再歸零或計算呼叫次數
+    for book in bot.ledgers:
+        flush = getattr(book.storage, "flush", None)
+        if flush is not None:
+            flush()
+
+
+def add_text(rng):
+    return f"新增 {rng.choice(ITEMS)} {rng.randint(20, 500)} bench"
+
+
+def query_text(rng, today):
+    day = today - timedelta(days=rng.randrange(365))
+    return f"查詢 {day:%Y%m%d}"
+
+
+def stats_text(rng, today):
+    day = today - timedelta(days=rng.randrange(365))
+    return rng.choice([
+        f"統計 {day:%Y%m%d}",
+        f"統計週 {day:%Y%m%d}",
+        f"統計月 {day:%Y%m}",
+        f"統計年 {day.year}",
+        f"統計季 {day.year}Q{(day.month - 1) // 3 + 1}",
+        f"統計區間 {day:%Y%m%d} {today:%Y%m%d}",
+    ])
+
+
+def build_workload(scenario, args, today, rng):
+    # 回傳 {使用者: [(文字, group_id), ...]}；同一個使用者的事件依序送出
+    per_user = max(1, args.events // args.users)
+    users = [f"Ubench{scenario}{i:04d}" for i in range(args.users)]
+    group_id = f"Cbench{scenario}"
+    if scenario == "add":
+        return {u: [(add_text(rng), None) for _ in range(per_user)] for u in users}
+    if scenario == "query":
+        return {u: [(query_text(rng, today), group_id) for _ in range(per_user)] for u in users}
+    if scenario == "stats":
+        return {u: [(stats_text(rng, today), group_id) for _ in range(per_user)] for u in users}
+    # concurrent：同一個群組帳本上混合新增、查詢與統計
+    mixed = []
+    for _ in range(per_user * args.users):
+        roll = rng.random()
+        if roll < 0.5:
+            mixed.append((add_text(rng), group_id))
+        elif roll < 0.75:
+            mixed.append((query_text(rng, today), group_id))
+        else:
+            mixed.append((stats_text(rng, today), group_id))
+    return {u: mixed[i::args.users] for i, u in enumerate(users)}
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def run(bot, scenario, args):
+    rng = random.Random(args.seed)
+    today = date.today()
+    sheets, line = setup(bot, args)
+    if scenario in ("query", "stats", "concurrent"):
+        seed_group_ledger(bot, f"Cbench{scenario}", args.ledger_size, today, rng)
+    flush_storages(bot)
+    for ws in sheets.worksheets():
+        ws.reset()
+    workload = build_workload(scenario, args, today, rng)
+    latencies = []
+    errors = []
+
+    def play(user_events):
+        user, events = user_events
+        for text, group_id in events:
+            body, signature = signed_webhook(SECRET, [text_event(text, user, group_id)])
+            start = time.perf_counter()
+            try:
+                for event in bot.handler.parser.parse(body, signature):
+                    bot.dispatch_event(event)
+            except Exception as e:
+                errors.append(e)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(play, workload.items()))
+    elapsed = time.perf_counter() - start
+    flush_storages(bot)
+
+    latencies.sort()
+    events = len(latencies) or 1
+    print(
+        f"{scenario:<11} {len(latencies):6d} events  {len(latencies) / elapsed:8.1f} ev/s  "
+        f"p50={percentile(latencies, 0.5) * 1000:7.1f} ms  p99={percentile(latencies, 0.99) * 1000:7.1f} ms  "
+        f"sheets/event={sheets.total_calls() / events:5.2f}  line/event={line.total_calls() / events:5.2f}  "
+        f"errors={len(errors)}"
+    )
+    if args.verbose:
+        calls = {}
+        for ws in sheets.worksheets():
+            for name, n in ws.calls.items():
+                calls[name] = calls.get(name, 0) + n
+        print(f"{'':<11} sheets={calls} line={line.calls}")
+    if errors:
+        print(f"{'':<11} first error: {errors[0]!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=SCENARIOS + ("all",), default="all")
+    parser.add_argument("--events", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--ledger-size", type=int, default=20000, help="查詢／統計情境預先放入的紀錄筆數")
+    parser.add_argument("--sheets-latency-ms", type=float, default=50)
+    parser.add_argument("--sheets-read-latency-ms", type=float, help="讀取的延遲，預設與寫入相同")
+    parser.add_argument("--line-latency-ms", type=float, default=20)
+    parser.add_argument("--backend", default="sheets", help="LEDGER_BACKEND：sheets、sqlite、sqlite+sheets")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("-v", "--verbose", action="store_true", help="列出各 API 方法的呼叫次數")
+    args = parser.parse_args()
+
+    os.environ["LEDGER_BACKEND"] = args.backend
+    if args.backend != "sheets":
+        os.environ.setdefault("SQLITE_PATH", ":memory:")
+    import main as bot
+
+    print(
+        f"backend={args.backend} sheets_latency={args.sheets_latency_ms}ms "
+        f"line_latency={args.line_latency_ms}ms threads={args.threads} users={args.users}"
+    )
+    for scenario in (SCENARIOS if args.scenario == "all" else (args.scenario,)):
+        run(bot, scenario, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""離線壓測用的假 Google Sheet、假 LineBotApi 與帶簽章的 webhook 產生器。"""
+import base64
+import hashlib
+import hmac
+import json
+import re
+import threading
+import time
+import uuid
+
+_CELL = re.compile(r"^([A-Z]+)(\d+)(?::([A-Z]+)(\d*))?$")
+
+
+def _col_number(letters):
+    n = 0
+    for ch in letters:
+        n = n * 26 + ord(ch) - 64
+    return n
+
+
+class CallCounter:
+    def __init__(self, latency_ms=0):
+        self.latency_ms = latency_ms
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def _call(self, name, latency_ms=None):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        latency_ms = self.latency_ms if latency_ms is None else latency_ms
+        if latency_ms:
+            time.sleep(latency_ms / 1000)
+
+    def total_calls(self):
+        with self._lock:
+            return sum(self.calls.values())
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+
+
+class GridLimitError(Exception):
+    # 相當於 Sheets API 讀寫超出工作表欄數時的 "exceeds grid limits"
+    pass
+
+
+class FakeWorksheet(CallCounter):
+    # gspread Worksheet 中 bot 會用到的方法；第 1 列是標題（headers 為 None 時是空的工作表）
+    def __init__(self, title, headers, latency_ms=0, read_latency_ms=None, cols=26):
+        super().__init__(latency_ms)
+        self.title = title
+        self.read_latency_ms = latency_ms if read_latency_ms is None else read_latency_ms
+        self.rows = [list(headers)] if headers else []
+        self.col_count = cols
+        self._rows_lock = threading.Lock()
+
+    def _check_cols(self, range_name, last_col):
+        if last_col > self.col_count:
+            raise GridLimitError(f"Range ('{self.title}'!{range_name}) exceeds grid limits. Max columns: {self.col_count}")
+
+    def add_cols(self, cols):
+        self._call("add_cols")
+        self.col_count += cols
+
+    def seed(self, rows):
+        with self._rows_lock:
+            self.rows.extend(list(r) for r in rows)
+
+    def get_all_records(self):
+        self._call("get_all_records", self.read_latency_ms)
+        with self._rows_lock:
+            headers, rows = self.rows[0], self.rows[1:]
+            return [dict(zip(headers, row + [""] * (len(headers) - len(row)))) for row in rows]
+
+    def get(self, range_name):
+        self._call("get", self.read_latency_ms)
+        m = _CELL.match(range_name)
+        start_col, start_row = _col_number(m.group(1)), int(m.group(2))
+        end_col = _col_number(m.group(3) or m.group(1))
+        self._check_cols(range_name, end_col)
+        with self._rows_lock:
+            # 「A2:B」這種沒有結束列的範圍代表到最後一列
+            end_row = int(m.group(4)) if m.group(4) else (len(self.rows) if m.group(3) else start_row)
+            return [list(row[start_col - 1:end_col]) for row in self.rows[start_row - 1:end_row]]
+
+    def append_rows(self, rows, **kwargs):
+        return self._append("append_rows", rows)
+
+    def append_row(self, row, **kwargs):
+        return self._append("append_row", [row])
+
+    def _append(self, name, rows):
+        self._call(name)
+        with self._rows_lock:
+            start = len(self.rows) + 1
+            self.rows.extend(list(r) for r in rows)
+            end = len(self.rows)
+        return {"updates": {"updatedRange": f"'{self.title}'!A{start}:D{end}", "updatedRows": len(rows)}}
+
+    def update(self, range_name=None, values=None, **kwargs):
+        self._call("update")
+        m = _CELL.match(range_name)
+        start_col, start_row = _col_number(m.group(1)), int(m.group(2))
+        self._check_cols(range_name, start_col - 1 + max((len(v) for v in values), default=0))
+        with self._rows_lock:
+            for offset, values_row in enumerate(values):
+                row = self.rows[start_row - 1 + offset]
+                row.extend([""] * (start_col - 1 + len(values_row) - len(row)))
+                row[start_col - 1:start_col - 1 + len(values_row)] = values_row
+
+    def delete_rows(self, start_index, end_index=None):
+        self._call("delete_rows")
+        with self._rows_lock:
+            del self.rows[start_index - 1:(end_index or start_index)]
+
+
+class FakeSpreadsheet:
+    # sheet1 預設 26 欄且已有標題列；其他工作表要由 bot 自己以 add_worksheet 建立，欄數照傳入的 cols
+    def __init__(self, headers, latency_ms=0, read_latency_ms=None):
+        self.headers = headers
+        self.latency_ms = latency_ms
+        self.read_latency_ms = read_latency_ms
+        self._sheets = {}
+        self._lock = threading.Lock()
+        self.sheet1 = self._sheets["工作表1"] = FakeWorksheet("工作表1", headers, latency_ms, read_latency_ms)
+
+    def worksheet(self, title):
+        import gspread
+
+        with self._lock:
+            if title not in self._sheets:
+                raise gspread.WorksheetNotFound(title)
+            return self._sheets[title]
+
+    def add_worksheet(self, title, rows=1000, cols=26):
+        with self._lock:
+            ws = self._sheets[title] = FakeWorksheet(title, None, self.latency_ms, self.read_latency_ms, cols)
+            return ws
+
+    def worksheets(self):
+        with self._lock:
+            return list(self._sheets.values())
+
+    def total_calls(self):
+        return sum(ws.total_calls() for ws in self.worksheets())
+
+
+class FakeLineBotApi(CallCounter):
+    def reply_message(self, reply_token, messages, **kwargs):
+        self._call("reply_message")
+
+    def push_message(self, to, messages, **kwargs):
+        self._call("push_message")
+
+
+def text_event(text, user_id, group_id=None, timestamp_ms=None):
+    source = {"type": "user", "userId": user_id}
+    if group_id:
+        source = {"type": "group", "groupId": group_id, "userId": user_id}
+    return {
+        "type": "message",
+        "mode": "active",
+        "timestamp": timestamp_ms or int(time.time() * 1000),
+        "source": source,
+        "webhookEventId": uuid.uuid4().hex.upper(),
+        "deliveryContext": {"isRedelivery": False},
+        "replyToken": uuid.uuid4().hex,
+        "message": {"type": "text", "id": str(uuid.uuid4().int)[:18], "quoteToken": uuid.uuid4().hex, "text": text},
+    }
+
+
+def signed_webhook(channel_secret, events, destination="Ubench"):
+    # 回傳 (body, X-Line-Signature)，與 LINE 平台送來的請求格式相同
+    body = json.dumps({"destination": destination, "events": events}, ensure_ascii=False)
+    digest = hmac.new(channel_secret.encode("utf-8"), body.encode("utf-8"), hashlib.sha256).digest()
+    return body, base64.b64encode(digest).decode("utf-8")
@@ -0,0 +1,102 @@
+"""本機 LINE Messaging API 模擬伺服器，可注入延遲、429、5xx 與 reply token 過期。
+
+    python benchmarks/mock_line_server.py --port 8080 --latency-ms 30 --rate-limit 0.05
+    LINE_API_ENDPOINT=http://127.0.0.1:8080 uvicorn main:app
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockLineServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, latency_ms=0, rate_limit=0.0, server_error=0.0, expired_token=0.0, seed=None):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.latency_ms = latency_ms
+        self.rate_limit = rate_limit
+        self.server_error = server_error
+        self.expired_token = expired_token
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.connections = 0
+
+    @property
+    def endpoint(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def count(self, key):
+        with self.lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def roll(self):
+        with self.lock:
+            return self.random.random()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 才能 keep-alive，才量得出連線池的效果
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        server = self.server
+        if server.latency_ms:
+            time.sleep(server.latency_ms / 1000)
+        kind = self.path.rsplit("/", 1)[-1]
+        roll = server.roll()
+        if roll < server.rate_limit:
+            server.count(f"{kind}:429")
+            return self._send(429, {"message": "The API rate limit has been exceeded. Try again later."})
+        roll -= server.rate_limit
+        if roll < server.server_error:
+            server.count(f"{kind}:500")
+            return self._send(500, {"message": "Internal server error"})
+        roll -= server.server_error
+        if kind == "reply" and roll < server.expired_token:
+            server.count("reply:400")
+            return self._send(400, {"message": "Invalid reply token"})
+        server.count(f"{kind}:200")
+        self._send(200, {})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--rate-limit", type=float, default=0.0)
+    parser.add_argument("--server-error", type=float, default=0.0)
+    parser.add_argument("--expired-token", type=float, default=0.0)
+    args = parser.parse_args()
+    server = MockLineServer(args.port, args.latency_ms, args.rate_limit, args.server_error, args.expired_token)
+    print(f"mock LINE API listening on {server.endpoint}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
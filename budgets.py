@@ -0,0 +1,122 @@
+import os
+
+from aggregates import amount_of
+from ledger import month_of
+
+# 每月預算，存在各帳本的設定中：
+#   預算 餐飲 6000 早餐 午餐 晚餐   某一類的每月上限，可列出這一類包含哪些項目（未列出時就是同名的項目）
+#   預算 6000                       整本帳的每月總預算
+TOTAL = "總預算"
+THRESHOLDS = tuple(sorted(float(t) for t in os.getenv("BUDGET_ALERT_THRESHOLDS", "0.8,1.0").split(",")))
+
+
+class BudgetError(ValueError):
+    pass
+
+
+def parse_budget(args):
+    # args 為「預算」之後的字詞，回傳 (分類, 上限, 包含的項目)
+    if not args:
+        raise BudgetError("格式：預算 [分類] 金額 [項目...]")
+    if args[0].isdigit():
+        category, rest = TOTAL, args
+    else:
+        category, rest = args[0], args[1:]
+    if not rest or not rest[0].isdigit():
+        raise BudgetError("預算金額必須是正整數")
+    return category, int(rest[0]), rest[1:]
+
+
+class Budgets:
+    def __init__(self, settings):
+        self.settings = settings
+        self.alerts = 0
+
+    def of(self, ledger_id):
+        return self.settings.get(ledger_id).get("budgets", {})
+
+    def set(self, ledger_id, category, limit, items=()):
+        value = self.settings.get(ledger_id)
+        value.setdefault("budgets", {})[category] = {"limit": limit, "items": list(items)}
+        self.settings.set(ledger_id, value)
+
+    def remove(self, ledger_id, category):
+        value = self.settings.get(ledger_id)
+        if value.get("budgets", {}).pop(category, None) is None:
+            return False
+        self.settings.set(ledger_id, value)
+        return True
+
+    @staticmethod
+    def _items(category, budget):
+        # None 代表整本帳
+        if category == TOTAL:
+            return None
+        return budget["items"] or [category]
+
+    @staticmethod
+    def _spent(items, summary):
+        if summary is None:
+            return 0
+        total, per_item = summary
+        if items is None:
+            return total
+        return sum(per_item.get(i, 0) for i in items)
+
+    def usage(self, ledger_id, cache, month):
+        # 回傳 [(分類, 已花費, 上限), ...]，總預算排第一
+        budgets = self.of(ledger_id)
+        if not budgets:
+            return []
+        summary = cache.summary("month", month)
+        ordered = sorted(budgets.items(), key=lambda kv: (kv[0] != TOTAL, kv[0]))
+        return [(c, self._spent(self._items(c, b), summary), b["limit"]) for c, b in ordered]
+
+    def check(self, ledger_id, cache, added=(), removed=()):
+        # 寫入後呼叫：只看這次寫入影響的月份與分類，以每月累計推回寫入前的花費，
+        # 跨過 80%、100% 等門檻時回傳提醒文字
+        budgets = self.of(ledger_id)
+        if not budgets:
+            return []
+        deltas = {}
+        for sign, records in ((1, added), (-1, removed)):
+            for r in records:
+                per_item = deltas.setdefault(month_of(r["日期"]), {})
+                per_item[str(r["項目"])] = per_item.get(str(r["項目"]), 0) + sign * amount_of(r)
+        alerts = []
+        for month, per_item in sorted(deltas.items()):
+            summary = cache.summary("month", month)
+            for category, budget in budgets.items():
+                items = self._items(category, budget)
+                delta = sum(per_item.values()) if items is None else sum(per_item.get(i, 0) for i in items)
+                if delta <= 0:
+                    continue
+                after = self._spent(items, summary)
+                limit = budget["limit"]
+                crossed = [t for t in THRESHOLDS if after - delta < t * limit <= after]
+                if crossed:
+                    alerts.append(format_alert(category, month, after, limit))
+        self.alerts += len(alerts)
+        return alerts
+
+
+def _label(category):
+    return "本月總預算" if category == TOTAL else f"「{category}」預算"
+
+
+def format_alert(category, month, spent, limit):
+    percent = round(spent * 100 / limit) if limit else 100
+    if spent >= limit:
+        over = f"，超出 {spent - limit} 元" if spent > limit else ""
+        return f"🚨 {month} {_label(category)}已用完：{spent} / {limit} 元（{percent}%）{over}"
+    return f"⚠️ {month} {_label(category)}已用 {percent}%：{spent} / {limit} 元，還剩 {limit - spent} 元"
+
+
+def format_usage(usage):
+    lines = []
+    for category, spent, limit in usage:
+        percent = round(spent * 100 / limit) if limit else 100
+        mark = "🚨" if spent >= limit else "⚠️" if spent >= THRESHOLDS[0] * limit else "✅"
+        name = "總預算" if category == TOTAL else category
+        lines.append(f"{mark} {name}：{spent} / {limit} 元（{percent}%）")
+    return "\n".join(lines)
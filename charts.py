@@ -0,0 +1,163 @@
+import calendar
+import importlib.util
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+# 圖表在獨立的 process pool 裡用 matplotlib 畫成 PNG，不佔用處理 webhook 的執行緒與 GIL。
+# matplotlib 是選用套件：沒有安裝時「圖表」指令會回覆未啟用，其他功能不受影響。
+CHART_FONTS = ["Noto Sans CJK TC", "Noto Sans TC", "Microsoft JhengHei", "PingFang TC", "Heiti TC", "WenQuanYi Zen Hei", "DejaVu Sans"]
+PIE_SLICES = 8
+# 超過這個時間的舊圖檔在啟動時清掉（上次執行留下的）
+CHART_MAX_AGE = 24 * 3600
+
+
+def available():
+    return importlib.util.find_spec("matplotlib") is not None
+
+
+def render_month(path, month, title, per_item, per_day):
+    # 在子行程中執行：上半部是各項目的圓餅圖，下半部是當月每天的長條圖
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib import pyplot as plt
+
+    font = os.getenv("CHART_FONT")
+    plt.rcParams["font.sans-serif"] = ([font] if font else []) + CHART_FONTS
+    plt.rcParams["axes.unicode_minus"] = False
+
+    ranked = sorted(per_item.items(), key=lambda kv: -kv[1])
+    if len(ranked) > PIE_SLICES:
+        ranked = ranked[:PIE_SLICES - 1] + [("其他", sum(v for _, v in ranked[PIE_SLICES - 1:]))]
+    ranked = [(k, v) for k, v in ranked if v > 0]
+
+    fig, (pie, bar) = plt.subplots(2, 1, figsize=(8, 10), gridspec_kw={"height_ratios": [3, 2]})
+    fig.suptitle(title, fontsize=16)
+    if ranked:
+        pie.pie([v for _, v in ranked], labels=[f"{k}\n{v}" for k, v in ranked], autopct="%1.0f%%", startangle=90, counterclock=False)
+    pie.set_aspect("equal")
+    year, mon = (int(x) for x in month.split("-"))
+    days = range(1, calendar.monthrange(year, mon)[1] + 1)
+    bar.bar([str(d) for d in days], [per_day.get(f"{month}-{d:02d}", 0) for d in days], color="#4C9A6A")
+    bar.set_xlabel("日")
+    bar.set_ylabel("元")
+    bar.tick_params(axis="x", labelsize=8)
+    fig.tight_layout()
+    fig.savefig(path, dpi=100)
+    plt.close(fig)
+    return path
+
+
+class ChartRenderer:
+    # 以 (帳本, 月份) 為鍵快取畫好的圖，並記住當時的資料版本；
+    # 版本沒變就直接回傳同一張圖，資料一改就重畫並刪掉舊檔。
+    # 同一張圖同時被多人要求時只會畫一次。
+    # CHART_DIR：圖檔目錄。同一台機器上的 uvicorn worker 預設共用同一個暫存目錄，
+    # LINE 取圖時不論連到哪個 worker 都拿得到；跨多台機器時必須指定共用的目錄（例如掛載的磁碟）。
+    def __init__(self, directory=None, workers=None, max_entries=None):
+        self.directory = directory or os.getenv("CHART_DIR") or os.path.join(tempfile.gettempdir(), "linebot-charts")
+        os.makedirs(self.directory, exist_ok=True)
+        self._prune()
+        if workers is None:
+            workers = int(os.getenv("CHART_WORKERS", "1"))
+        if max_entries is None:
+            max_entries = int(os.getenv("CHART_CACHE_SIZE", "200"))
+        self.workers = workers
+        self.max_entries = max_entries
+        self._pool = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.renders = 0
+        self.errors = 0
+
+    def _executor(self):
+        if self._pool is None:
+            # spawn：子行程不會複製到 webhook 執行緒與連線的狀態
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def _prune(self):
+        cutoff = time.time() - CHART_MAX_AGE
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if name.endswith(".png") and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def _remove_file(self, filename):
+        try:
+            os.remove(os.path.join(self.directory, filename))
+        except OSError:
+            pass
+
+    def _drop(self, entry):
+        _, filename, future = entry
+        if future is not None and not future.done():
+            # 還在畫的圖等畫完再刪
+            future.add_done_callback(lambda _: self._remove_file(filename))
+        else:
+            self._remove_file(filename)
+
+    def get(self, key, version, month, title, per_item, per_day, timeout=None):
+        # 回傳圖檔名稱；畫圖失敗或逾時會丟出例外
+        with self._lock:
+            entry = self._entries.get(key)
+            future = None
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                future = entry[2]
+                if future is None and os.path.exists(os.path.join(self.directory, entry[1])):
+                    self.hits += 1
+                    return entry[1]
+            if future is None:
+                if entry is not None:
+                    self._drop(entry)
+                # 檔名隨機，圖片網址無法被猜到
+                filename = f"{uuid.uuid4().hex}.png"
+                future = self._executor().submit(render_month, os.path.join(self.directory, filename), month, title, per_item, per_day)
+                entry = self._entries[key] = (version, filename, future)
+                self.renders += 1
+                while len(self._entries) > self.max_entries:
+                    self._drop(self._entries.popitem(last=False)[1])
+        try:
+            future.result(timeout=timeout)
+        except TimeoutError:
+            # 繼續在背景畫，下一次要求同一張圖時就能直接用
+            raise
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+                if isinstance(e, BrokenProcessPool):
+                    # 子行程異常結束（例如記憶體不足），下次重開一個 pool
+                    self._pool = None
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+                    self._remove_file(entry[1])
+            raise
+        with self._lock:
+            if self._entries.get(key) is entry:
+                self._entries[key] = (version, entry[1], None)
+        return entry[1]
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "available": available(),
+                "cached": len(self._entries),
+                "hits": self.hits,
+                "renders": self.renders,
+                "errors": self.errors,
+            }
@@ -0,0 +1,115 @@
+import re
+from datetime import datetime, timedelta
+
+# 一則訊息記多筆：以換行、逗號、分號、頓號分隔，例如
+#   早餐 80, 午餐 120 麥當勞, 咖啡 $65
+#   昨天 晚餐 1,200元 聚餐
+#   0510 停車 60
+# 日期前綴會套用到同一則訊息中後面的每一筆，直到出現新的日期為止。
+
+# 千分位逗號（1,200）不是分隔符號，先拿掉
+_THOUSANDS = re.compile(r"(?<=\d),(?=\d{3}(?!\d))")
+_SEPARATORS = re.compile(r"[\n,，;；、]+")
+_AMOUNT = re.compile(r"^(?:NT\$|\$|＄)?(\d+(?:\.\d+)?)(?:元|塊|圓)?$", re.IGNORECASE)
+# 「早餐80」「咖啡65元」這種項目和金額黏在一起的寫法
+_GLUED = re.compile(r"^(\D*?\D)(?:NT\$|\$|＄)?(\d+(?:\.\d+)?)(?:元|塊|圓)?$", re.IGNORECASE)
+_RELATIVE_DAYS = {"今天": 0, "昨天": 1, "前天": 2}
+
+
+class Entry:
+    __slots__ = ("date", "item", "amount", "note")
+
+    def __init__(self, date, item, amount, note=""):
+        self.date = date
+        self.item = item
+        self.amount = amount
+        self.note = note
+
+    def row(self):
+        return [self.date, self.item, self.amount, self.note]
+
+
+def _whole(text):
+    # 金額只記整數元；有小數時回報錯誤，不自行四捨五入
+    value = float(text)
+    if not value.is_integer():
+        raise ValueError(text)
+    return int(value)
+
+
+def parse_amount(token):
+    # 不是金額時回傳 None；金額有小數時丟出 ValueError
+    m = _AMOUNT.match(token.replace(",", ""))
+    if not m:
+        return None
+    return _whole(m.group(1))
+
+
+def parse_date_token(token, today):
+    # 回傳 "YYYY-MM-DD"；不是日期時回傳 None
+    if token in _RELATIVE_DAYS:
+        return (today - timedelta(days=_RELATIVE_DAYS[token])).strftime("%Y-%m-%d")
+    for fmt in ("%Y%m%d", "%Y-%m-%d", "%Y/%m/%d"):
+        try:
+            return datetime.strptime(token, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            pass
+    # 只有月日時以今年為準：0510、5/10
+    for fmt in ("%m%d", "%m/%d"):
+        if fmt == "%m%d" and not (len(token) == 4 and token.isdigit()):
+            continue
+        try:
+            d = datetime.strptime(token, fmt)
+            return d.replace(year=today.year).strftime("%Y-%m-%d")
+        except ValueError:
+            pass
+    return None
+
+
+def _parse_segment(tokens, date):
+    # 回傳 (Entry 或 None, 錯誤訊息或 None)；找不到金額時 Entry 為 None
+    try:
+        return _parse_tokens(tokens, date)
+    except ValueError as e:
+        return None, f"「{' '.join(tokens)}」的金額 {e} 不是整數"
+
+
+def _parse_tokens(tokens, date):
+    for i, token in enumerate(tokens):
+        amount = parse_amount(token)
+        if amount is not None and i > 0:
+            return Entry(date, " ".join(tokens[:i]), amount, " ".join(tokens[i + 1:])), None
+    m = _GLUED.match(tokens[0])
+    if m:
+        return Entry(date, m.group(1), _whole(m.group(2)), " ".join(tokens[1:])), None
+    if parse_amount(tokens[0]) is not None:
+        return None, f"「{' '.join(tokens)}」缺少項目"
+    return None, None
+
+
+def parse_entries(text, today):
+    # 回傳 (entries, errors)；沒有金額的片段視為上一筆的備註（例如「午餐 120 麥當勞, 好吃」）
+    entries = []
+    errors = []
+    date = today.strftime("%Y-%m-%d")
+    for segment in _SEPARATORS.split(_THOUSANDS.sub("", text)):
+        tokens = segment.split()
+        if not tokens:
+            continue
+        parsed = parse_date_token(tokens[0], today)
+        if parsed:
+            date = parsed
+            tokens = tokens[1:]
+            if not tokens:
+                continue
+        entry, error = _parse_segment(tokens, date)
+        if entry:
+            entries.append(entry)
+        elif error:
+            errors.append(error)
+        elif entries and not parsed:
+            last = entries[-1]
+            last.note = f"{last.note}, {segment.strip()}" if last.note else segment.strip()
+        else:
+            errors.append(f"「{segment.strip()}」找不到金額")
+    return entries, errors
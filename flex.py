@@ -0,0 +1,76 @@
+from functools import lru_cache
+
+# LINE carousel 最多 12 個 bubble
+CAROUSEL_LIMIT = 12
+
+
+def _button(label, text):
+    return {"type": "button", "style": "primary", "action": {"type": "message", "label": label, "text": text}}
+
+
+# 主選單內容固定，啟動時建好一次即可
+MAIN_MENU = {
+    "type": "bubble",
+    "body": {
+        "type": "box",
+        "layout": "vertical",
+        "spacing": "md",
+        "contents": [
+            {"type": "text", "text": "📌 請選擇操作功能", "weight": "bold", "size": "lg", "align": "center"},
+            _button("➕ 新增", "新增"),
+            _button("📋 查詢", "查詢"),
+            _button("✏️ 修改", "修改"),
+            _button("🗑️ 刪除", "刪除"),
+            _button("📊 統計", "統計"),
+            _button("👥 結算", "結算"),
+            _button("💰 預算", "預算"),
+            _button("📈 圖表", "圖表"),
+        ]
+    }
+}
+
+
+# 主選單
+def get_main_menu():
+    return MAIN_MENU
+
+
+@lru_cache(maxsize=4096)
+def _bubble(record_id, date, item, amount, note):
+    # 同一列內容不變時直接重用；回傳的 dict 是共用的，呼叫端不可修改
+    return {
+        "type": "bubble",
+        "body": {
+            "type": "box",
+            "layout": "vertical",
+            "contents": [
+                {"type": "text", "text": f"📝 編號 {record_id}"},
+                {"type": "text", "text": f"📅 {date}"},
+                {"type": "text", "text": f"📝 {item}"},
+                {"type": "text", "text": f"💰 {amount}"},
+                {"type": "text", "text": f"🗒️ {note}"}
+            ]
+        }
+    }
+
+
+def record_bubble(record):
+    # 顯示紀錄編號，修改、刪除時輸入這個編號
+    return _bubble(record["ID"], str(record["日期"]), str(record["項目"]), str(record["金額"]), str(record["備註"]))
+
+
+# 選單
+def create_flex_list(records):
+    return {"type": "carousel", "contents": [record_bubble(r) for r in records]}
+
+
+def paginate(items, page, per_page=CAROUSEL_LIMIT):
+    # page 從 1 起算；回傳 (這一頁的項目, 總頁數)
+    pages = max(1, -(-len(items) // per_page))
+    page = min(max(page, 1), pages)
+    start = (page - 1) * per_page
+    return items[start:start + per_page], pages
+
+
+def bubble_cache_info():
+    return _bubble.cache_info()._asdict()
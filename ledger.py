@@ -0,0 +1,220 @@
+import os
+import threading
+import time
+from bisect import insort
+
+from aggregates import Aggregates
+from metrics import stage
+from split import Balances
+
+# 記帳表單欄位順序（與 Google Sheet 第一列標題一致）
+HEADERS = ["日期", "項目", "金額", "備註"]
+# 每筆紀錄固定不變的編號，存在資料欄位之後的一欄
+ID_FIELD = "ID"
+SHEET_HEADERS = HEADERS + [ID_FIELD]
+
+
+def parse_id(value):
+    # 編號為正整數；空白或格式不對時回傳 None
+    try:
+        record_id = int(str(value).strip().lstrip("#＃"))
+    except (TypeError, ValueError):
+        return None
+    return record_id if record_id > 0 else None
+
+
+def row_to_record(row_data):
+    row_data = list(row_data)
+    while len(row_data) < len(SHEET_HEADERS):
+        row_data.append("")
+    record = dict(zip(SHEET_HEADERS, row_data))
+    record[ID_FIELD] = parse_id(record[ID_FIELD])
+    return record
+
+
+def month_of(date_str):
+    # "2025-05-10" → "2025-05"
+    return str(date_str)[:7]
+
+
+class LedgerCache:
+    # 帳本快取：第一次讀取時整張表載入記憶體，之後寫入時同步更新快取，
+    # 超過 TTL 或手動呼叫 refresh() 時才重新向 Google Sheet 讀取。
+    # 紀錄以編號（ID）為鍵，修改、刪除都是 O(1)，不會讓其他紀錄或索引失效。
+    # 同時維護「日期 → 編號」與「年月 → 編號」兩個索引、每日與每月的累計金額，
+    # 以及分帳成員的餘額，查詢、統計與結算都不必掃描整本帳。
+    def __init__(self, loader, ttl=None):
+        self._loader = loader
+        if ttl is None:
+            ttl = float(os.getenv("LEDGER_CACHE_TTL", "300"))
+        self.ttl = ttl
+        self._records = None
+        self._list = None
+        self._by_date = {}
+        self._by_month = {}
+        self.aggregates = Aggregates()
+        self.balances = Balances()
+        # 隨每筆紀錄增減的衍生資料
+        self._views = (self.aggregates, self.balances)
+        self._loaded_at = 0.0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def _expired(self):
+        return self.ttl > 0 and time.monotonic() - self._loaded_at > self.ttl
+
+    def _load(self):
+        with stage("cache_load"):
+            self._records = {r[ID_FIELD]: r for r in self._loader()}
+            self._list = None
+            self._reindex()
+        self._loaded_at = time.monotonic()
+
+    def _reindex(self):
+        self._by_date = {}
+        self._by_month = {}
+        for view in self._views:
+            view.clear()
+        for record_id, r in self._records.items():
+            self._index_add(record_id, r)
+            for view in self._views:
+                view.add(r)
+
+    def _index_add(self, record_id, record):
+        date = str(record["日期"])
+        for table, key in ((self._by_date, date), (self._by_month, month_of(date))):
+            ids = table.setdefault(key, [])
+            if ids and ids[-1] > record_id:
+                insort(ids, record_id)
+            else:
+                ids.append(record_id)
+
+    def _index_remove(self, record_id, record):
+        date = str(record["日期"])
+        for table, key in ((self._by_date, date), (self._by_month, month_of(date))):
+            ids = table.get(key)
+            if ids and record_id in ids:
+                ids.remove(record_id)
+                if not ids:
+                    del table[key]
+
+    def _ensure_loaded(self):
+        if self._records is None or self._expired():
+            self.misses += 1
+            self._load()
+        else:
+            self.hits += 1
+
+    def records(self):
+        # 依編號順序的所有紀錄（不含已刪除）
+        with self._lock:
+            self._ensure_loaded()
+            if self._list is None:
+                self._list = list(self._records.values())
+            return self._list
+
+    def refresh(self):
+        with self._lock:
+            self.misses += 1
+            self._load()
+            return self.records()
+
+    def invalidate(self):
+        with self._lock:
+            self._records = None
+            self._list = None
+
+    def get(self, record_id):
+        with self._lock:
+            self._ensure_loaded()
+            return self._records.get(record_id)
+
+    def __len__(self):
+        with self._lock:
+            self._ensure_loaded()
+            return len(self._records)
+
+    # 回傳某日／某月的紀錄，依編號排列
+    def by_date(self, date_str):
+        with self._lock:
+            self._ensure_loaded()
+            return [self._records[i] for i in self._by_date.get(date_str, [])]
+
+    def by_month(self, month_str):
+        with self._lock:
+            self._ensure_loaded()
+            return [self._records[i] for i in self._by_month.get(month_str, [])]
+
+    # 統計：回傳 (總金額, {項目: 金額})，查無資料時回傳 None
+    def summary(self, kind, *args):
+        with self._lock:
+            self._ensure_loaded()
+            with stage("aggregate"):
+                return getattr(self.aggregates, kind)(*args)
+
+    def month_snapshot(self, month_str):
+        # 同一把鎖內取得某月的 (資料版本, 統計, 每日金額)，版本與內容一定對得上
+        with self._lock:
+            self._ensure_loaded()
+            with stage("aggregate"):
+                a = self.aggregates
+                return a.version(month_str), a.month(month_str), a.daily(month_str)
+
+    def settlement(self):
+        with self._lock:
+            self._ensure_loaded()
+            with stage("settle"):
+                return dict(self.balances.net), self.balances.settle()
+
+    def append(self, record):
+        with self._lock:
+            if self._records is not None:
+                record_id = record[ID_FIELD]
+                old = self._records.get(record_id)
+                if old is not None:
+                    self._remove(record_id, old)
+                self._records[record_id] = record
+                self._list = None
+                self._index_add(record_id, record)
+                for view in self._views:
+                    view.add(record)
+
+    def update(self, record_id, record):
+        record = dict(record, **{ID_FIELD: record_id})
+        with self._lock:
+            if self._records is not None and record_id in self._records:
+                old = self._records[record_id]
+                if str(old["日期"]) != str(record["日期"]):
+                    self._index_remove(record_id, old)
+                    self._index_add(record_id, record)
+                for view in self._views:
+                    view.remove(old)
+                    view.add(record)
+                self._records[record_id] = record
+                self._list = None
+
+    def delete(self, record_id):
+        with self._lock:
+            if self._records is not None and record_id in self._records:
+                self._remove(record_id, self._records[record_id])
+
+    def _remove(self, record_id, record):
+        self._index_remove(record_id, record)
+        for view in self._views:
+            view.remove(record)
+        del self._records[record_id]
+        self._list = None
+
+    def stats(self):
+        with self._lock:
+            age = None
+            if self._records is not None:
+                age = round(time.monotonic() - self._loaded_at, 1)
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._records) if self._records is not None else 0,
+                "age_seconds": age,
+                "ttl_seconds": self.ttl,
+            }
@@ -0,0 +1,131 @@
+"""帳本批次匯入／匯出。
+
+    python ledger_io.py export --ledger default --format csv > ledger.csv
+    python ledger_io.py import ledger.csv --ledger default
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+from datetime import datetime
+
+from ledger import HEADERS
+
+FORMATS = ("csv", "jsonl")
+IMPORT_CHUNK = 500
+
+
+def export_lines(storage, fmt="csv", chunk_size=IMPORT_CHUNK):
+    # 逐筆產生輸出內容，不在記憶體中組出整份檔案
+    if fmt not in FORMATS:
+        raise ValueError(f"不支援的格式：{fmt}")
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == "csv":
+        writer.writerow(HEADERS)
+    for record in storage.iter_records(chunk_size):
+        if fmt == "jsonl":
+            yield json.dumps({h: record[h] for h in HEADERS}, ensure_ascii=False) + "\n"
+            continue
+        writer.writerow([record[h] for h in HEADERS])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if fmt == "csv" and buffer.tell():
+        yield buffer.getvalue()
+
+
+def _iter_rows(lines, fmt):
+    # 回傳 (行號, {欄位: 值})
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == "jsonl":
+        for line_num, line in enumerate(lines, start=1):
+            if line.strip():
+                try:
+                    yield line_num, json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_num, e
+    else:
+        raise ValueError(f"不支援的格式：{fmt}")
+
+
+def validate_row(row):
+    # 回傳 [日期, 項目, 金額, 備註]，格式錯誤時丟出 ValueError
+    if isinstance(row, Exception):
+        raise ValueError(f"JSON 格式錯誤：{row}")
+    date = str(row.get("日期") or "").strip()
+    if len(date) == 8 and date.isdigit():
+        date = f"{date[:4]}-{date[4:6]}-{date[6:]}"
+    datetime.strptime(date, "%Y-%m-%d")
+    item = str(row.get("項目") or "").strip()
+    if not item:
+        raise ValueError("項目不可為空白")
+    amount = int(str(row.get("金額")).replace(",", "").strip())
+    note = str(row.get("備註") or "").strip()
+    return [date, item, amount, note]
+
+
+def import_lines(storage, lines, fmt="csv", chunk_size=IMPORT_CHUNK, dry_run=False):
+    # 每 chunk_size 筆驗證一次、以一次批次寫入；格式錯誤的列略過並回報行號
+    imported = 0
+    errors = []
+    chunk = []
+
+    def flush():
+        nonlocal imported
+        if chunk and not dry_run:
+            storage.append(chunk)
+        imported += len(chunk)
+        chunk.clear()
+
+    for line_num, row in _iter_rows(lines, fmt):
+        try:
+            chunk.append(validate_row(row))
+        except (ValueError, TypeError) as e:
+            errors.append({"line": line_num, "error": str(e)})
+        if len(chunk) >= chunk_size:
+            flush()
+    flush()
+    return {"imported": imported, "errors": errors[:100], "error_count": len(errors)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    exp = sub.add_parser("export", help="匯出帳本到標準輸出")
+    exp.add_argument("--ledger", default="default")
+    exp.add_argument("--format", choices=FORMATS, default="csv")
+    imp = sub.add_parser("import", help="從檔案匯入帳本")
+    imp.add_argument("file")
+    imp.add_argument("--ledger", default="default")
+    imp.add_argument("--format", choices=FORMATS)
+    imp.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK)
+    imp.add_argument("--dry-run", action="store_true", help="只驗證不寫入")
+    args = parser.parse_args()
+
+    # 使用與 bot 相同的儲存設定（LEDGER_BACKEND 等環境變數）
+    from main import ledgers
+
+    storage = ledgers.get(args.ledger).storage
+    if args.command == "export":
+        for line in export_lines(storage, args.format):
+            sys.stdout.write(line)
+        return
+    fmt = args.format or ("jsonl" if args.file.endswith(".jsonl") else "csv")
+    with open(args.file, encoding="utf-8-sig", newline="") as f:
+        result = import_lines(storage, f, fmt, args.chunk_size, args.dry_run)
+    # sqlite+sheets 的試算表寫入由背景執行緒處理，結束前要等它寫完，否則程式一結束就遺失
+    flush = getattr(storage, "flush", None)
+    if flush is not None:
+        flush()
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if result["error_count"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import os
+import threading
+
+from ledger import LedgerCache, row_to_record
+from storage import DEFAULT_LEDGER
+
+
+def ledger_id_of(source):
+    # 群組、聊天室共用一本帳；一對一聊天則是每位使用者自己的帳本
+    ledger_id = getattr(source, "group_id", None) or getattr(source, "room_id", None) or getattr(source, "user_id", None)
+    if not ledger_id or ledger_id == os.getenv("LEGACY_LEDGER_ID"):
+        # LEGACY_LEDGER_ID 指定的使用者或群組沿用分帳本之前的 sheet1
+        return DEFAULT_LEDGER
+    return ledger_id
+
+
+class Ledger:
+    # 一本帳：儲存分區加上它自己的快取、索引與統計
+    def __init__(self, ledger_id, storage):
+        self.id = ledger_id
+        self.storage = storage
+        self.cache = LedgerCache(storage.load)
+        storage.on_append = lambda row: self.cache.append(row_to_record(row))
+
+
+class LedgerRegistry:
+    # 帳本只在第一次用到時開啟，之後重複使用同一個工作表 handle 與快取
+    def __init__(self, storage_factory):
+        self._storage_factory = storage_factory
+        self._ledgers = {}
+        self._lock = threading.Lock()
+        self._opening = {}
+
+    def get(self, ledger_id):
+        ledger = self._ledgers.get(ledger_id)
+        if ledger is not None:
+            return ledger
+        with self._lock:
+            lock = self._opening.setdefault(ledger_id, threading.Lock())
+        # 每本帳各自一把鎖，開啟某本帳時不會卡住其他帳本
+        with lock:
+            ledger = self._ledgers.get(ledger_id)
+            if ledger is None:
+                ledger = Ledger(ledger_id, self._storage_factory(ledger_id))
+                self._ledgers[ledger_id] = ledger
+        return ledger
+
+    def __iter__(self):
+        return iter(list(self._ledgers.values()))
+
+    def stats(self):
+        ledgers = list(self._ledgers.values())
+        return {
+            "ledgers": len(ledgers),
+            "cache_hits": sum(l.cache.hits for l in ledgers),
+            "cache_misses": sum(l.cache.misses for l in ledgers),
+            "records": sum(l.cache.stats()["size"] for l in ledgers),
+        }
@@ -1,7 +1,10 @@
-from fastapi import FastAPI, Request
-from linebot import LineBotApi, WebhookHandler
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.staticfiles import StaticFiles
+from linebot import WebhookHandler
 from linebot.models import (
-    MessageEvent, TextMessage, TextSendMessage, FlexSendMessage, QuickReply, QuickReplyButton, MessageAction
+    MessageEvent, TextMessage, TextSendMessage, FlexSendMessage, ImageSendMessage, QuickReply, QuickReplyButton, MessageAction
 )
 from linebot.exceptions import InvalidSignatureError
 import json
@@ -11,11 +14,37 @@ from datetime import datetime, timedelta
 import pytz
 import os
 import base64
+import hmac
+import threading
+import io
+import tempfile
+import time
+import logging
+from ledger import HEADERS, SHEET_HEADERS, parse_id, row_to_record
+from aggregates import parse_date, week_range
+from worker import EventDispatcher
+from storage import DEFAULT_LEDGER, RecordNotFound, SheetStorage, build_storage
+from ledgers import LedgerRegistry, ledger_id_of
+from split import format_split_note, parse_shares
+from state_store import build_state_store
+from router import CommandRouter, Context
+from flex import create_flex_list, get_main_menu, paginate, record_bubble, bubble_cache_info
+from messaging import Messenger, build_line_bot_api, source_id_of
+from ledger_io import FORMATS, export_lines, import_lines
+from entries import parse_entries
+from sheets_client import LazySpreadsheet, TokenRefresher, credentials_of
+from settings_store import build_settings_store
+from budgets import Budgets, BudgetError, format_usage, parse_budget
+from reports import REPORT_KINDS, ReportScheduler, build_jobs, daily_report, weekly_report
+from charts import ChartRenderer, available as charts_available
+import metrics
 
 app = FastAPI()
-line_bot_api = LineBotApi(os.getenv("LINE_CHANNEL_ACCESS_TOKEN"))
+line_bot_api = build_line_bot_api(os.getenv("LINE_CHANNEL_ACCESS_TOKEN"))
+messenger = Messenger(line_bot_api)
 handler = WebhookHandler(os.getenv("LINE_CHANNEL_SECRET"))
-user_state = {}
+user_state = build_state_store()
+logger = logging.getLogger(__name__)
 
 def get_gspread_client_from_env():
     encoded = os.getenv("GOOGLE_CREDENTIALS_BASE64")
@@ -25,499 +54,776 @@ def get_gspread_client_from_env():
     creds = ServiceAccountCredentials.from_json_keyfile_dict(credentials_dict, scope)
     return gspread.authorize(creds)
 
-gc = get_gspread_client_from_env()
-sheet = gc.open("記帳表單").sheet1
+token_refresher = TokenRefresher()
 
-def get_all_records():
-    return sheet.get_all_records()
+def open_spreadsheet():
+    gc = get_gspread_client_from_env()
+    # access token 由背景執行緒在到期前換新，請求不會卡在 OAuth
+    token_refresher.watch(credentials_of(gc))
+    return gc.open("記帳表單")
+
+# 試算表只在第一次用到時開啟，之後所有帳本共用這個 handle
+spreadsheet = LazySpreadsheet(open_spreadsheet)
+
+def get_spreadsheet():
+    return spreadsheet.get()
+
+def open_worksheet(ledger_id):
+    book = get_spreadsheet()
+    if ledger_id == DEFAULT_LEDGER:
+        return book.sheet1
+    try:
+        return book.worksheet(ledger_id)
+    except gspread.WorksheetNotFound:
+        ws = book.add_worksheet(title=ledger_id, rows=1000, cols=SheetStorage.COLUMNS)
+        ws.append_row(SHEET_HEADERS)
+        return ws
+
+# 每個使用者／群組／聊天室各自一本帳（各自的工作表或 SQLite 分區）
+# LEDGER_BACKEND 決定資料存在 Google Sheet、SQLite，或 SQLite 為主並同步到試算表
+ledgers = LedgerRegistry(lambda ledger_id: build_storage(open_worksheet, ledger_id))
+
+def open_settings_sheet():
+    book = get_spreadsheet()
+    try:
+        return book.worksheet("設定")
+    except gspread.WorksheetNotFound:
+        ws = book.add_worksheet(title="設定", rows=100, cols=2)
+        ws.append_row(["帳本", "設定"])
+        return ws
+
+# 各帳本的預算與定期摘要訂閱
+settings = build_settings_store(open_settings_sheet)
+budgets = Budgets(settings)
 
 def to_dash_date(s):
     if len(s) == 8 and s.isdigit():
         return f"{s[:4]}-{s[4:6]}-{s[6:]}"
     return s
 
-def filter_by_date(records, date_str):
-    return [r for r in records if r["日期"] == date_str]
-
-def record_expense(item, amount, note):
+def record_expense(book, item, amount, note):
     now = datetime.now(pytz.timezone("Asia/Taipei"))
     date = now.strftime("%Y-%m-%d")
-    row = [date, item, amount, note]
-    sheet.append_row(row)
-    return date
-
-# 主選單
-def get_main_menu():
-    return {
-        "type": "bubble",
-        "body": {
-            "type": "box",
-            "layout": "vertical",
-            "spacing": "md",
-            "contents": [
-                {"type": "text", "text": "📌 請選擇操作功能", "weight": "bold", "size": "lg", "align": "center"},
-                {"type": "button", "style": "primary", "action": {"type": "message", "label": "➕ 新增", "text": "新增"}},
-                {"type": "button", "style": "primary", "action": {"type": "message", "label": "📋 查詢", "text": "查詢"}},
-                {"type": "button", "style": "primary", "action": {"type": "message", "label": "✏️ 修改", "text": "修改"}},
-                {"type": "button", "style": "primary", "action": {"type": "message", "label": "🗑️ 刪除", "text": "刪除"}},
-                {"type": "button", "style": "primary", "action": {"type": "message", "label": "📊 統計", "text": "統計"}}
-            ]
-        }            
-    }
-
-# 選單
-def create_flex_list(records, start_row=2):
-    bubbles = []
-    for idx, r in enumerate(records):
-        row = start_row + idx
-        b = {
-            "type": "bubble",
-            "body": {
-                "type": "box",
-                "layout": "vertical",
-                "contents": [
-                    {"type": "text", "text": f"📝 第 {row - 1} 筆"},
-                    {"type": "text", "text": f"📅 {r['日期']}"},
-                    {"type": "text", "text": f"📝 {r['項目']}"},
-                    {"type": "text", "text": f"💰 {r['金額']}"},
-                    {"type": "text", "text": f"🗒️ {r['備註']}"}
-                ]
-            }
-        }
-        bubbles.append(b)
-    return {"type": "carousel", "contents": bubbles}    
+    return record_expenses(book, [[date, item, amount, note]])[0]
+
+def record_expenses(book, rows):
+    # 多筆一次批次寫入，回傳帶有編號的紀錄
+    ids = book.storage.append(rows)
+    return [row_to_record(list(row) + [record_id]) for row, record_id in zip(rows, ids)]
+
+def get_stat_quick_reply(now):
+    today = now.strftime("%Y%m%d")
+    yesterday = (now - timedelta(days=1)).strftime("%Y%m%d")
+    this_month = now.strftime("%Y%m")
+    last_month = (now.replace(day=1) - timedelta(days=1)).strftime("%Y%m")
+    return QuickReply(items=[
+        QuickReplyButton(action=MessageAction(label="今天", text=f"統計 {today}")),
+        QuickReplyButton(action=MessageAction(label="昨天", text=f"統計 {yesterday}")),
+        QuickReplyButton(action=MessageAction(label="本週", text=f"統計週 {today}")),
+        QuickReplyButton(action=MessageAction(label="本月", text=f"統計月 {this_month}")),
+        QuickReplyButton(action=MessageAction(label="上個月", text=f"統計月 {last_month}")),
+        QuickReplyButton(action=MessageAction(label="今年", text=f"統計年 {now.year}")),
+        QuickReplyButton(action=MessageAction(label="自訂日期", text="統計 自訂")),
+        QuickReplyButton(action=MessageAction(label="自訂年月", text="統計月 自訂")),
+        QuickReplyButton(action=MessageAction(label="本月圖表", text=f"圖表 {this_month}"))
+    ])
+
+def format_stats(title, label, summary):
+    total, per_item = summary
+    detail = "\n".join([f"{k}: {v}" for k, v in per_item.items()])
+    return f"📊 {title}：{label}\n總金額：{total} 元\n\n明細：\n{detail}"
+
+def event_key(event):
+    return getattr(event.source, "user_id", None) or "anonymous"
+
+def dispatch_event(event):
+    if isinstance(event, MessageEvent) and isinstance(event.message, TextMessage):
+        with metrics.event_scope():
+            handle_message(event)
+
+dispatcher = EventDispatcher(dispatch_event)
 
 @app.post("/callback")
 async def callback(request: Request):
     signature = request.headers["X-Line-Signature"]
     body = await request.body()
     try:
-        handler.handle(body.decode("utf-8"), signature)
+        with metrics.stage("signature"):
+            events = handler.parser.parse(body.decode("utf-8"), signature)
     except InvalidSignatureError:
-        return "Invalid signature", 400
-    return "OK", 200
+        raise HTTPException(status_code=400, detail="Invalid signature")
+    # 只做簽章驗證，事件交給背景執行緒處理，立即回應 LINE
+    # 佇列放不下整批時回 503，整批都不處理，由 LINE 重送
+    if not dispatcher.submit_many([(event_key(event), event) for event in events]):
+        raise HTTPException(status_code=503, detail="Busy")
+    return "OK"
+
+router = CommandRouter()
+
+def reply(event, messages):
+    messenger.reply(event, messages)
 
 @handler.add(MessageEvent, message=TextMessage)
 def handle_message(event):
     text = event.message.text.strip()
     user_id = event.source.user_id
     now = datetime.now(pytz.timezone("Asia/Taipei"))
-    records = get_all_records()
-
-    # ✅ 新增功能：可直接記帳或進入引導輸入模式
-    if text.startswith("新增"):
-        parts = text.split(maxsplit=3)
-
-        # ✅ 格式：新增 項目 金額 [備註]
-        if len(parts) >= 3:
-            _, item, amount_str = parts[:3]
-            note = parts[3] if len(parts) == 4 else ""
-            try:
-                amount = int(amount_str)
-                date = record_expense(item, amount, note)
-                msg = f"✅ 記帳成功"
-
-                all_rows = sheet.get_all_values()
-                last_row = all_rows[-1]
-                real_row_number = len(all_rows)
-
-                record = {
-                    "日期": last_row[0],
-                    "項目": last_row[1],
-                    "金額": last_row[2],
-                    "備註": last_row[3]
-                }
-                flex = create_flex_list([record], start_row=real_row_number)
-
-                line_bot_api.reply_message(event.reply_token, [
-                    TextSendMessage(text=msg),
-                    FlexSendMessage(alt_text="新增記錄", contents=flex["contents"][0])
+    ledger_id = ledger_id_of(event.source)
+    # 對話狀態以「帳本 + 使用者」區分，同一人在不同群組的流程互不干擾
+    ctx = Context(event, text, now, ledger_id, ledgers.get, user_state, f"{ledger_id}:{user_id}")
+    router.dispatch(ctx)
+
+def budget_alerts(ctx, added=(), removed=()):
+    # 預算提醒併在同一次回覆裡，不另外 push；資料已寫入，檢查失敗也要照常回覆記帳結果
+    try:
+        alerts = budgets.check(ctx.ledger_id, ctx.ledger, added=added, removed=removed)
+    except Exception:
+        logger.exception("預算檢查失敗：%s", ctx.ledger_id)
+        return []
+    return [TextSendMessage(text="\n".join(alerts))] if alerts else []
+
+def reply_recorded(ctx, record, msg="✅ 記帳成功"):
+    reply(ctx.event, [
+        TextSendMessage(text=msg),
+        FlexSendMessage(alt_text="新增記錄", contents=record_bubble(record))
+    ] + budget_alerts(ctx, added=[record]))
+
+# ✅ 新增功能：可直接記帳或進入引導輸入模式
+# ✅ 若只有輸入「新增」兩字 → 進入引導模式
+@router.command("新增")
+def add_start(ctx):
+    ctx.set_state({"step": "wait_detail"})
+    reply(ctx.event, TextSendMessage(
+        text="請輸入：項目 金額 [備註]，例如：\n早餐 80 QBurger\n\n一次記多筆可用逗號或換行分隔，也可加上日期：\n昨天 早餐 80, 午餐 120 麥當勞"
+    ))
+
+def add_entries(ctx, text, usage):
+    # 一則訊息可記多筆，全部解析成功才一次寫入
+    entries, errors = parse_entries(text, ctx.now.date())
+    if errors or not entries:
+        detail = "\n".join(errors) or "找不到要記帳的項目"
+        reply(ctx.event, TextSendMessage(text=f"❌ {detail}\n{usage}"))
+        return False
+    saved = record_expenses(ctx.book, [e.row() for e in entries])
+    if len(saved) == 1:
+        reply_recorded(ctx, saved[0])
+        return True
+    total = sum(e.amount for e in entries)
+    shown, pages = paginate(saved, 1)
+    msg = f"✅ 記帳成功，共 {len(saved)} 筆，合計 {total} 元"
+    if pages > 1:
+        msg += f"\n（僅顯示前 {len(shown)} 筆）"
+    flex = create_flex_list(shown)
+    reply(ctx.event, [
+        TextSendMessage(text=msg),
+        FlexSendMessage(alt_text="新增記錄", contents=flex)
+    ] + budget_alerts(ctx, added=saved))
+    return True
+
+# ✅ 格式：新增 項目 金額 [備註]，可用逗號或換行一次記多筆
+@router.prefix("新增 ", needs=("ledger",))
+def add_inline(ctx):
+    add_entries(ctx, ctx.text[len("新增"):], "請輸入：新增 項目 金額 [備註]，例如：\n新增 早餐 80 QBurger\n新增 早餐 80, 午餐 120 麥當勞, 咖啡 65")
+
+@router.step("wait_detail", needs=("ledger",))
+def add_detail(ctx):
+    if add_entries(ctx, ctx.text, "請重新輸入：項目 金額 [備註]，例如：\n早餐 80 QBurger"):
+        ctx.clear_state()
+
+# 使用者輸入「查詢」 → 顯示 quick reply 日期選擇
+@router.command("查詢")
+def query_menu(ctx):
+    today = ctx.now.strftime("%Y%m%d")
+    yesterday = (ctx.now - timedelta(days=1)).strftime("%Y%m%d")
+    reply(ctx.event, TextSendMessage(
+        text="請選擇要查詢的日期",
+        quick_reply=QuickReply(items=[
+            QuickReplyButton(action=MessageAction(label="今天", text=f"查詢 {today}")),
+            QuickReplyButton(action=MessageAction(label="昨天", text=f"查詢 {yesterday}")),
+            QuickReplyButton(action=MessageAction(label="自訂日期", text="查詢 自訂"))
+        ])
+    ))
+
+@router.command("查詢 自訂")
+def query_custom(ctx):
+    ctx.set_state({"step": "wait_custom_query_date"})
+    reply(ctx.event, TextSendMessage(
+        text="請輸入要查詢的日期（格式：20250510）"
+    ))
+
+def reply_query(ctx, date_str, empty_msg, page=1):
+    records = ctx.ledger.by_date(date_str)
+    if not records:
+        raise ValueError(empty_msg)
+    # 超過 carousel 上限時分頁，以 quick reply 切換上一頁／下一頁
+    shown, pages = paginate(records, page)
+    page = min(max(page, 1), pages)
+    flex = create_flex_list(shown)
+    buttons = []
+    target = date_str.replace("-", "")
+    if page > 1:
+        buttons.append(QuickReplyButton(action=MessageAction(label="上一頁", text=f"查詢 {target} {page - 1}")))
+    if page < pages:
+        buttons.append(QuickReplyButton(action=MessageAction(label="下一頁", text=f"查詢 {target} {page + 1}")))
+    reply(ctx.event, FlexSendMessage(
+        alt_text=f"查詢結果（{page}/{pages}）" if pages > 1 else "查詢結果",
+        contents=flex,
+        quick_reply=QuickReply(items=buttons) if buttons else None
+    ))
+    ctx.clear_state()  # 成功查到才移除狀態
+
+# ✅ 查詢 [日期] [頁數] 的格式處理（如：查詢 20250510、查詢 20250510 2）
+@router.prefix("查詢 ", needs=("ledger",))
+def query_date(ctx):
+    try:
+        parts = ctx.text.split()
+        date_str = to_dash_date(parts[1])
+        page = int(parts[2]) if len(parts) > 2 else 1
+        reply_query(ctx, date_str, f"{date_str} 沒有紀錄", page)
+    except Exception as e:
+        reply(ctx.event, TextSendMessage(text=f"❌ {e}"))
+
+# ✅ 處理自訂日期的輸入
+@router.step("wait_custom_query_date", needs=("ledger",))
+def query_custom_date(ctx):
+    try:
+        date_str = to_dash_date(ctx.text)
+        reply_query(ctx, date_str, f"❌ {date_str} 查無資料，請重新輸入 8 碼日期（如 20250510）")
+    except Exception as e:
+        reply(ctx.event, TextSendMessage(text=f"❌ {e}"))
+
+# 使用者輸入「修改」→ 進入引導模式
+@router.command("修改")
+def modify_start(ctx):
+    ctx.set_state({"step": "wait_modify_row"})
+    reply(ctx.event, TextSendMessage(
+        text="請輸入要修改的紀錄編號（查詢結果中的「📝 編號」，例如：2）"
+    ))
+
+# 等使用者輸入要修改哪一筆
+@router.step("wait_modify_row", needs=("ledger",))
+def modify_row(ctx):
+    try:
+        record_id = parse_id(ctx.text)
+        if record_id is None:
+            raise ValueError("請輸入紀錄編號（數字）")
+        if ctx.ledger.get(record_id) is None:
+            raise ValueError(f"❌ 編號 {record_id} 不存在，請重新輸入")
+
+        ctx.set_state({"step": "wait_modify_values", "record_id": record_id})
+        reply(ctx.event, TextSendMessage(
+            text="請輸入修改後的資料（格式：項目 金額 [備註]）例如：午餐 130 麥當勞"
+        ))
+    except Exception as e:
+        reply(ctx.event, TextSendMessage(
+            text=f"❌ {e}"
+        ))
+
+# 使用者輸入了項目 金額 [備註] → 執行修改
+@router.step("wait_modify_values", needs=("ledger",))
+def modify_values(ctx):
+    try:
+        record_id = ctx.state.get("record_id")
+
+        parts = ctx.text.split(maxsplit=2)
+        if len(parts) < 2:
+            raise ValueError("請輸入至少兩個欄位：項目 金額（備註可選）")
+
+        item = parts[0]
+        amount = int(parts[1])
+        note = parts[2] if len(parts) == 3 else ""
+
+        old = ctx.ledger.get(record_id)
+        if old is None:
+            raise RecordNotFound(record_id)
+
+        # 整列一次更新
+        record = row_to_record([old["日期"], item, amount, note, record_id])
+        ctx.storage.update(record_id, [record[h] for h in HEADERS])
+        ctx.ledger.update(record_id, record)
+        reply(ctx.event, [
+            TextSendMessage(text=f"✅ 編號 {record_id} 已修改成功"),
+            FlexSendMessage(alt_text="更新後資料", contents=record_bubble(record))
+        ] + budget_alerts(ctx, added=[record], removed=[old]))
+    except Exception as e:
+        reply(ctx.event, TextSendMessage(
+            text=f"❌ 修改失敗：{e}"
+        ))
+    ctx.clear_state()
+
+# ➖ 使用者輸入「刪除」
+@router.command("刪除")
+def delete_start(ctx):
+    ctx.set_state({"step": "wait_delete_row"})
+    reply(ctx.event, TextSendMessage(
+        text="請輸入你要刪除的紀錄編號（查詢結果中的「📝 編號」，例如：2）"
+    ))
+
+# ➖ 使用者輸入欲刪除的編號
+@router.step("wait_delete_row", needs=("ledger",))
+def delete_row(ctx):
+    try:
+        record_id = parse_id(ctx.text)
+        record = ctx.ledger.get(record_id) if record_id else None
+        if record is None:
+            raise ValueError(f"❌ 編號 {ctx.text} 的資料不存在，請重新輸入有效的編號")
+
+        ctx.set_state({"step": "confirm_delete", "record_id": record_id})
+        reply(ctx.event, [
+            FlexSendMessage(alt_text="確認刪除", contents=record_bubble(record)),
+            TextSendMessage(
+                text=f"⚠️ 確定要刪除編號 {record_id} 的資料嗎？",
+                quick_reply=QuickReply(items=[
+                    QuickReplyButton(action=MessageAction(label="✅ 確認刪除", text="刪除 確認")),
+                    QuickReplyButton(action=MessageAction(label="❌ 取消刪除", text="刪除 取消"))
                 ])
-            except:
-                line_bot_api.reply_message(event.reply_token, TextSendMessage(
-                    text="❌ 金額格式錯誤，請輸入：新增 項目 金額 [備註]，例如：\n新增 早餐 80 QBurger"
-                ))
-                return
-
-        # ✅ 若只有輸入「新增」兩字 → 進入引導模式
-        if len(parts) == 1:
-            user_state[user_id] = {"step": "wait_detail"}
-            line_bot_api.reply_message(event.reply_token, TextSendMessage(
-                text="請輸入：項目 金額 [備註]，例如：\n早餐 80 QBurger"
-            ))
-            return
-        
-    if user_id in user_state and user_state[user_id].get("step") == "wait_detail":
-        try:
-            parts = text.split(maxsplit=2)
-            if len(parts) < 2:
-                raise ValueError("請至少輸入：項目 金額，例如：\n早餐 80")
-            item = parts[0]
-            amount = int(parts[1])
-            note = parts[2] if len(parts) == 3 else ""
-            date = record_expense(item, amount, note)
-
-            msg = f"✅ 記帳成功"
-            all_rows = sheet.get_all_values()
-            last_row = all_rows[-1]
-            real_row_number = len(all_rows)
-
-            record = {
-                "日期": last_row[0],
-                "項目": last_row[1],
-                "金額": last_row[2],
-                "備註": last_row[3]
-            }
-            flex = create_flex_list([record], start_row=real_row_number)
-
-            line_bot_api.reply_message(event.reply_token, [
-                TextSendMessage(text=msg),
-                FlexSendMessage(alt_text="新增記錄", contents=flex["contents"][0])
-            ])
-            user_state.pop(user_id)
-        except Exception as e:
-            line_bot_api.reply_message(
-                event.reply_token,
-                TextSendMessage(text="❌ 格式錯誤，請重新輸入：項目 金額 [備註]，例如：\n早餐 80 QBurger")
             )
-            return
+        ])
+    except Exception as e:
+        reply(ctx.event, TextSendMessage(text=str(e)))
+
+# ➖ 確認刪除
+@router.command("刪除 確認", step="confirm_delete", needs=("ledger",))
+def delete_confirm(ctx):
+    record_id = ctx.state.get("record_id")
+    ctx.clear_state()
+    try:
+        ctx.storage.delete(record_id)
+    except RecordNotFound as e:
+        # 已被其他人刪除
+        ctx.ledger.delete(record_id)
+        reply(ctx.event, TextSendMessage(text=f"❌ {e}"))
+        return
+    ctx.ledger.delete(record_id)
+    reply(ctx.event, TextSendMessage(text=f"✅ 已刪除編號 {record_id} 的資料"))
+
+# ➖ 取消刪除
+@router.command("刪除 取消", step="confirm_delete")
+def delete_cancel(ctx):
+    ctx.clear_state()
+    reply(ctx.event, TextSendMessage(text="❎ 已取消刪除"))
+
+# ✅ 統計：第一階段 QuickReply 日期選擇
+@router.command("統計")
+def stat_menu(ctx):
+    reply(ctx.event, TextSendMessage(
+        text="請選擇要統計的範圍：",
+        quick_reply=get_stat_quick_reply(ctx.now)
+    ))
+
+# ✅ 統計：自訂 8 碼日期
+@router.command("統計 自訂")
+def stat_custom_date(ctx):
+    ctx.set_state({"step": "wait_custom_stat_date"})
+    reply(ctx.event, TextSendMessage(
+        text="請輸入 8 碼日期（如 20250507）"
+    ))
+
+# ✅ 統計：接收 8 碼日期後執行
+@router.step("wait_custom_stat_date", needs=("ledger",))
+def stat_custom_date_input(ctx):
+    try:
+        date_str = to_dash_date(ctx.text)
+        summary = ctx.ledger.summary("day", date_str)
+        if not summary:
+            raise ValueError(f"{date_str} 查無資料，請重新輸入 8 碼日期（如 20250510）")
+        msg = format_stats("統計日期", date_str, summary)
+        reply(ctx.event, TextSendMessage(text=msg))
+        ctx.clear_state()
+    except Exception as e:
+        reply(ctx.event, TextSendMessage(
+            text=f"❌ {e}\n請重新輸入 8 碼日期（如 20250510）"
+        ))
 
-    # 使用者輸入「查詢」 → 顯示 quick reply 日期選擇
-    if text == "查詢":
-        today = now.strftime("%Y%m%d")
-        yesterday = (now - timedelta(days=1)).strftime("%Y%m%d")
-        line_bot_api.reply_message(event.reply_token, TextSendMessage(
-            text="請選擇要查詢的日期",
-            quick_reply=QuickReply(items=[
-                QuickReplyButton(action=MessageAction(label="今天", text=f"查詢 {today}")),
-                QuickReplyButton(action=MessageAction(label="昨天", text=f"查詢 {yesterday}")),
-                QuickReplyButton(action=MessageAction(label="自訂日期", text="查詢 自訂"))
-            ])
+# ✅ 統計：自訂 6 碼年月
+@router.command("統計月 自訂")
+def stat_custom_month(ctx):
+    ctx.set_state({"step": "wait_custom_stat_month"})
+    reply(ctx.event, TextSendMessage(
+        text="請輸入 6 碼年月（如 202505）"
+    ))
+
+# ✅ 統計：接收 6 碼年月後執行
+@router.step("wait_custom_stat_month", needs=("ledger",))
+def stat_custom_month_input(ctx):
+    try:
+        month_str = ctx.text
+        if len(month_str) != 6 or not month_str.isdigit():
+            raise ValueError("請輸入正確格式：202505")
+        prefix = f"{month_str[:4]}-{month_str[4:]}"
+        summary = ctx.ledger.summary("month", prefix)
+        if not summary:
+            raise ValueError(f"{prefix} 查無資料，請重新輸入 6 碼年月（如 202505）")
+        msg = format_stats("統計月份", prefix, summary)
+        reply(ctx.event, TextSendMessage(text=msg))
+        ctx.clear_state()
+    except Exception as e:
+        reply(ctx.event, TextSendMessage(
+            text=f"❌ {e}\n請重新輸入 6 碼年月（如 202505）"
         ))
-        return
 
-    # ✅ 查詢 [日期] 的格式處理（如：查詢 20250510）
-    if text.startswith("查詢 "):
-        try:
-            target = text.split()[1]
-            if target == "自訂":
-                user_state[user_id] = {"step": "wait_custom_query_date"}
-                line_bot_api.reply_message(event.reply_token, TextSendMessage(
-                    text="請輸入要查詢的日期（格式：20250510）"
-                ))
-                return
-
-            date_str = to_dash_date(target)
-            matched = filter_by_date(records, date_str)
-            if not matched:
-                raise ValueError(f"{date_str} 沒有紀錄")
-            start_row = 2 + records.index(matched[0])  # 從哪一列開始
-            flex = create_flex_list(matched, start_row=start_row)
-            line_bot_api.reply_message(event.reply_token, FlexSendMessage(alt_text="查詢結果", contents=flex))
-            user_state.pop(user_id)  # 成功查到才移除狀態
-        except Exception as e:
-            line_bot_api.reply_message(event.reply_token, TextSendMessage(text=f"❌ {e}"))
-        return
-    
-    # ✅ 處理自訂日期的輸入
-    if user_id in user_state and user_state[user_id].get("step") == "wait_custom_query_date":
-        try:
-            date_str = to_dash_date(text.strip())
-            matched = filter_by_date(records, date_str)
-            if not matched:
-                raise ValueError(f"❌ {date_str} 查無資料，請重新輸入 8 碼日期（如 20250510）")
-            
-            start_row = 2 + records.index(matched[0])
-            flex = create_flex_list(matched, start_row=start_row)
-            line_bot_api.reply_message(event.reply_token, FlexSendMessage(alt_text="查詢結果", contents=flex))
-            user_state.pop(user_id)  # 成功查到才移除狀態
-        except Exception as e:
-            line_bot_api.reply_message(event.reply_token, TextSendMessage(text=f"❌ {e}"))
-            return
-        return
-    
-    # 使用者輸入「修改」→ 進入引導模式
-    if text == "修改":
-        user_state[user_id] = {"step": "wait_modify_row"}
-        line_bot_api.reply_message(event.reply_token, TextSendMessage(
-            text="請輸入要修改第幾筆（例如：2）"
+# ✅ 統計：快速日期（今天/昨天）
+@router.prefix("統計 ", needs=("ledger",))
+def stat_date(ctx):
+    try:
+        date_str = to_dash_date(ctx.text.split()[1])
+        summary = ctx.ledger.summary("day", date_str)
+        if not summary:
+            raise ValueError(f"{date_str} 沒有資料")
+        msg = format_stats("統計日期", date_str, summary)
+        reply(ctx.event, TextSendMessage(text=msg))
+    except Exception as e:
+        reply(ctx.event, TextSendMessage(
+            text=f"❌ {e}\n請重新選擇要統計的日期：",
+            quick_reply=get_stat_quick_reply(ctx.now)
         ))
-        return
 
-    # 等使用者輸入要修改哪一筆
-    if user_id in user_state and user_state[user_id].get("step") == "wait_modify_row":
-        try:
-            row = int(text.strip())
-            all_rows = sheet.get_all_values()
+# ✅ 統計月：快速月份（本月/上月）
+@router.prefix("統計月 ", needs=("ledger",))
+def stat_month(ctx):
+    try:
+        month_str = ctx.text.split()[1]
+        if len(month_str) != 6 or not month_str.isdigit():
+            raise ValueError("格式錯誤，請輸入 6 碼年月（如 202505）")
 
-            if row < 1 or row >= len(all_rows):
-                raise ValueError(f"❌ 第 {row} 筆不存在，請重新輸入")
+        year, month = month_str[:4], month_str[4:]
+        prefix = f"{year}-{month.zfill(2)}"
+        summary = ctx.ledger.summary("month", prefix)
 
-            user_state[user_id]["row"] = row
-            user_state[user_id]["step"] = "wait_modify_values"
-            line_bot_api.reply_message(event.reply_token, TextSendMessage(
-                text="請輸入修改後的資料（格式：項目 金額 [備註]）例如：午餐 130 麥當勞"
-            ))
-        except Exception as e:
-            line_bot_api.reply_message(event.reply_token, TextSendMessage(
-                text=f"❌ {e}"
-            ))
-        return
+        if not summary:
+            raise ValueError(f"{prefix} 查無資料")
 
-    # 使用者輸入了項目 金額 [備註] → 執行修改
-    if user_id in user_state and user_state[user_id].get("step") == "wait_modify_values":
-        try:
-            all_rows = sheet.get_all_values()
-            row = user_state[user_id]["row"]  # 使用者輸入的是「第幾筆資料」（不含標題列）
-            sheet_row = row + 1               # 所以實際在 Google Sheet 中是 row+1
-            
-            parts = text.split(maxsplit=2)
-            if len(parts) < 2:
-                raise ValueError("請輸入至少兩個欄位：項目 金額（備註可選）")
-
-            item = parts[0]
-            amount = int(parts[1])
-            note = parts[2] if len(parts) == 3 else ""
-
-            sheet.update_cell(sheet_row, 2, item)
-            sheet.update_cell(sheet_row, 3, amount)
-            sheet.update_cell(sheet_row, 4, note)
-
-            row_data = sheet.row_values(sheet_row)
-            while len(row_data) < 4:
-                row_data.append("")
-
-            record = {
-                "日期": row_data[0],
-                "項目": row_data[1],
-                "金額": row_data[2],
-                "備註": row_data[3]
-            }
-            flex = create_flex_list([record], start_row=row + 1)
-            line_bot_api.reply_message(event.reply_token, [
-                TextSendMessage(text=f"✅ 第 {row} 筆已修改成功"),
-                FlexSendMessage(alt_text="更新後資料", contents=flex["contents"][0])
-            ])
-        except Exception as e:
-            line_bot_api.reply_message(event.reply_token, TextSendMessage(
-                text=f"❌ 修改失敗：{e}"
-            ))
-        user_state.pop(user_id)
-        return
+        msg = format_stats("統計月份", prefix, summary)
 
-    # ➖ 使用者輸入「刪除」
-    if text == "刪除":
-        user_state[user_id] = {"step": "wait_delete_row"}
-        line_bot_api.reply_message(event.reply_token, TextSendMessage(
-            text="請輸入你要刪除的第幾筆資料（例如：2）"
+        reply(ctx.event, TextSendMessage(text=msg))
+    except Exception as e:
+        # ⬇️ QuickReply 選單重新出現
+        reply(ctx.event, TextSendMessage(
+            text=f"❌ {e}\n請重新選擇要統計的月份：",
+            quick_reply=get_stat_quick_reply(ctx.now)
         ))
-        return
 
-    # ➖ 使用者輸入欲刪除的行數
-    if user_id in user_state and user_state[user_id].get("step") == "wait_delete_row":
-        try:
-            row = int(text.strip())
-            all_rows = sheet.get_all_values()
-            sheet_row = row + 1
-            if row < 1 or sheet_row > len(all_rows):
-                raise ValueError(f"❌ 第 {row} 筆資料不存在，請重新輸入有效的編號")
-
-            row_data = all_rows[sheet_row - 1]
-            while len(row_data) < 4:
-                row_data.append("")
-            record = {
-                "日期": row_data[0],
-                "項目": row_data[1],
-                "金額": row_data[2],
-                "備註": row_data[3]
-            }
-            flex = create_flex_list([record], start_row=row + 1)
-            user_state[user_id] = {"step": "confirm_delete", "row": row}
-            line_bot_api.reply_message(event.reply_token, [
-                FlexSendMessage(alt_text="確認刪除", contents=flex["contents"][0]),
-                TextSendMessage(
-                    text=f"⚠️ 確定要刪除第 {row} 筆資料嗎？",
-                    quick_reply=QuickReply(items=[
-                        QuickReplyButton(action=MessageAction(label="✅ 確認刪除", text="刪除 確認")),
-                        QuickReplyButton(action=MessageAction(label="❌ 取消刪除", text="刪除 取消"))
-                    ])
-                )
-            ])
-        except Exception as e:
-            line_bot_api.reply_message(event.reply_token, TextSendMessage(text=str(e)))
-        return
-    
-    # ➖ 確認刪除
-    if text == "刪除 確認" and user_state.get(user_id, {}).get("step") == "confirm_delete":
-        row = user_state[user_id]["row"]
-        sheet.delete_rows(row + 1)
-        user_state.pop(user_id)
-        line_bot_api.reply_message(event.reply_token, TextSendMessage(text=f"✅ 已刪除第 {row} 筆資料"))
-        return
-    
-    # ➖ 取消刪除
-    if text == "刪除 取消" and user_state.get(user_id, {}).get("step") == "confirm_delete":
-        user_state.pop(user_id)
-        line_bot_api.reply_message(event.reply_token, TextSendMessage(text="❎ 已取消刪除"))
-        return
-    
-    # ✅ 統計：第一階段 QuickReply 日期選擇
-    if text == "統計":
-        today = now.strftime("%Y%m%d")
-        yesterday = (now - timedelta(days=1)).strftime("%Y%m%d")
-        this_month = now.strftime("%Y%m")
-        last_month = (now.replace(day=1) - timedelta(days=1)).strftime("%Y%m")
-
-        line_bot_api.reply_message(event.reply_token, TextSendMessage(
-            text="請選擇要統計的範圍：",
-            quick_reply=QuickReply(items=[
-                QuickReplyButton(action=MessageAction(label="今天", text=f"統計 {today}")),
-                QuickReplyButton(action=MessageAction(label="昨天", text=f"統計 {yesterday}")),
-                QuickReplyButton(action=MessageAction(label="本月", text=f"統計月 {this_month}")),
-                QuickReplyButton(action=MessageAction(label="上個月", text=f"統計月 {last_month}")),
-                QuickReplyButton(action=MessageAction(label="自訂日期", text="統計 自訂")),
-                QuickReplyButton(action=MessageAction(label="自訂年月", text="統計月 自訂"))
-            ])
+# ✅ 統計週 / 統計季 / 統計年 / 統計區間
+#    統計週 20250510（該日所在的週一～週日）、統計季 2025Q2、統計年 2025、統計區間 20250501 20250515
+@router.prefix("統計週 ", "統計季 ", "統計年 ", "統計區間 ", needs=("ledger",))
+def stat_range(ctx):
+    try:
+        command, *args = ctx.text.split()
+        expected = 2 if command == "統計區間" else 1
+        if len(args) != expected:
+            raise ValueError(f"{command} 需要 {expected} 個參數")
+        if command == "統計週":
+            start, end = week_range(parse_date(to_dash_date(args[0])))
+            label, summary = f"{start} ~ {end}", ctx.ledger.summary("span", start, end)
+        elif command == "統計季":
+            year, sep, q = args[0].upper().partition("Q")
+            if not sep or q not in ("1", "2", "3", "4"):
+                raise ValueError("季別請輸入 Q1～Q4")
+            label, summary = f"{year} 第 {q} 季", ctx.ledger.summary("quarter", int(year), int(q))
+        elif command == "統計年":
+            label, summary = f"{args[0]} 年", ctx.ledger.summary("year", int(args[0]))
+        else:
+            start = parse_date(to_dash_date(args[0]))
+            end = parse_date(to_dash_date(args[1]))
+            label, summary = f"{min(start, end)} ~ {max(start, end)}", ctx.ledger.summary("span", start, end)
+        if not summary:
+            raise ValueError(f"{label} 查無資料")
+        reply(ctx.event, TextSendMessage(text=format_stats("統計範圍", label, summary)))
+    except ValueError as e:
+        reply(ctx.event, TextSendMessage(
+            text=f"❌ {e}\n格式：統計週 20250510／統計季 2025Q2／統計年 2025／統計區間 20250501 20250515",
+            quick_reply=get_stat_quick_reply(ctx.now)
         ))
-        return
 
-    # ✅ 統計：自訂 8 碼日期
-    if text == "統計 自訂":
-        user_state[user_id] = {"step": "wait_custom_stat_date"}
-        line_bot_api.reply_message(event.reply_token, TextSendMessage(
-            text="請輸入 8 碼日期（如 20250507）"
+# 👥 分帳：分帳 項目 金額 付款人 分攤成員...
+#    平均：分帳 晚餐 900 小明 小明 小華 小美
+#    比例：分帳 晚餐 900 小明 小明*2 小華*1
+#    指定：分帳 晚餐 900 小明 小明=300 小華=600
+@router.command("分帳", needs=("ledger",))
+@router.prefix("分帳 ", needs=("ledger",))
+def split_expense(ctx):
+    parts = ctx.text.split()
+    try:
+        if len(parts) < 5:
+            raise ValueError("格式：分帳 項目 金額 付款人 分攤成員...")
+        _, item, amount_str, payer, *specs = parts
+        amount = int(amount_str)
+        if amount <= 0:
+            raise ValueError("金額必須大於 0")
+        shares = parse_shares(amount, specs)
+        # 也檢查付款人名稱（不能有 = * ,）
+        note = format_split_note(payer, shares)
+    except ValueError as e:
+        reply(ctx.event, TextSendMessage(
+            text=f"❌ {e}\n例如：\n分帳 晚餐 900 小明 小明 小華 小美\n分帳 晚餐 900 小明 小明*2 小華*1\n分帳 晚餐 900 小明 小明=300 小華=600"
         ))
         return
-
-    # ✅ 統計：接收 8 碼日期後執行
-    if user_id in user_state and user_state[user_id].get("step") == "wait_custom_stat_date":
-        try:
-            date_str = to_dash_date(text.strip())
-            matched = filter_by_date(get_all_records(), date_str)
-            if not matched:
-                raise ValueError(f"{date_str} 查無資料，請重新輸入 8 碼日期（如 20250510）")
-            total = sum(int(r["金額"]) for r in matched)
-            per_item = {}
-            for r in matched:
-                name = r["項目"]
-                per_item[name] = per_item.get(name, 0) + int(r["金額"])
-            detail = "\n".join([f"{k}: {v}" for k, v in per_item.items()])
-            msg = f"📊 統計日期：{date_str}\n總金額：{total} 元\n\n明細：\n{detail}"
-            line_bot_api.reply_message(event.reply_token, TextSendMessage(text=msg))
-            user_state.pop(user_id)
-        except Exception as e:
-            line_bot_api.reply_message(event.reply_token, TextSendMessage(
-                text=f"❌ {e}\n請重新輸入 8 碼日期（如 20250510）"
-            ))
+    record = record_expense(ctx.book, item, amount, note)
+    detail = "\n".join(f"{name}：{value} 元" for name, value in shares.items())
+    reply_recorded(ctx, record, msg=f"✅ 分帳成功，{payer} 付了 {amount} 元\n\n分攤：\n{detail}")
+
+# 👥 結算：以最少的轉帳次數清償所有分帳餘額
+@router.command("結算", needs=("ledger",))
+def settle_up(ctx):
+    net, transfers = ctx.ledger.settlement()
+    if not transfers:
+        reply(ctx.event, TextSendMessage(text="👥 目前沒有需要結算的分帳"))
         return
-    
-    # ✅ 統計：自訂 6 碼年月
-    if text == "統計月 自訂":
-        user_state[user_id] = {"step": "wait_custom_stat_month"}
-        line_bot_api.reply_message(event.reply_token, TextSendMessage(
-            text="請輸入 6 碼年月（如 202505）"
-        ))
+    balance = "\n".join(f"{name}：{'+' if value > 0 else ''}{value} 元" for name, value in sorted(net.items(), key=lambda kv: -kv[1]))
+    plan = "\n".join(f"{debtor} → {creditor}：{value} 元" for debtor, creditor, value in transfers)
+    reply(ctx.event, TextSendMessage(
+        text=f"👥 結算（共 {len(transfers)} 筆轉帳）\n{plan}\n\n目前餘額：\n{balance}"
+    ))
+
+# 🔄 手動重新同步 Google Sheet（例如直接在試算表上改過資料）
+@router.command("同步", needs=("ledger",))
+def resync(ctx):
+    records = ctx.ledger.refresh()
+    reply(ctx.event, TextSendMessage(text=f"🔄 已重新同步，共 {len(records)} 筆資料"))
+
+# 💰 預算：每月上限，記帳後用掉 80%、100% 時提醒
+#    預算                       查看本月預算使用情形
+#    預算 6000                  整本帳的每月總預算
+#    預算 餐飲 6000 早餐 午餐   某一類的每月上限（未列出項目時就是同名的項目）
+#    預算 刪除 餐飲             刪除預算（預算 餐飲 0 也可以）
+BUDGET_USAGE = "格式：\n預算 6000\n預算 餐飲 6000 早餐 午餐 晚餐\n預算 刪除 餐飲"
+
+@router.command("預算", needs=("ledger",))
+def budget_status(ctx):
+    usage = budgets.usage(ctx.ledger_id, ctx.ledger, ctx.now.strftime("%Y-%m"))
+    if not usage:
+        reply(ctx.event, TextSendMessage(text=f"💰 尚未設定預算\n{BUDGET_USAGE}"))
         return
+    reply(ctx.event, TextSendMessage(text=f"💰 本月預算（{ctx.now:%Y-%m}）\n{format_usage(usage)}"))
 
-    # ✅ 統計：接收 6 碼年月後執行
-    if user_id in user_state and user_state[user_id].get("step") == "wait_custom_stat_month":
-        try:
-            month_str = text.strip()
-            if len(month_str) != 6 or not month_str.isdigit():
-                raise ValueError("請輸入正確格式：202505")
-            prefix = f"{month_str[:4]}-{month_str[4:]}"
-            matched = [r for r in get_all_records() if r["日期"].startswith(prefix)]
-            if not matched:
-                raise ValueError(f"{prefix} 查無資料，請重新輸入 6 碼年月（如 202505）")
-            total = sum(int(r["金額"]) for r in matched)
-            per_item = {}
-            for r in matched:
-                name = r["項目"]
-                per_item[name] = per_item.get(name, 0) + int(r["金額"])
-            detail = "\n".join([f"{k}: {v}" for k, v in per_item.items()])
-            msg = f"📊 統計月份：{prefix}\n總金額：{total} 元\n\n明細：\n{detail}"
-            line_bot_api.reply_message(event.reply_token, TextSendMessage(text=msg))
-            user_state.pop(user_id)
-        except Exception as e:
-            line_bot_api.reply_message(event.reply_token, TextSendMessage(
-                text=f"❌ {e}\n請重新輸入 6 碼年月（如 202505）"
-            ))
+@router.prefix("預算 ", needs=("ledger",))
+def budget_set(ctx):
+    args = ctx.text.split()[1:]
+    try:
+        if args and args[0] == "刪除":
+            category = args[1] if len(args) > 1 else "總預算"
+            if not budgets.remove(ctx.ledger_id, category):
+                raise BudgetError(f"沒有「{category}」的預算")
+            reply(ctx.event, TextSendMessage(text=f"🗑️ 已刪除「{category}」的預算"))
+            return
+        category, limit, items = parse_budget(args)
+        if limit == 0:
+            budgets.remove(ctx.ledger_id, category)
+            reply(ctx.event, TextSendMessage(text=f"🗑️ 已刪除「{category}」的預算"))
+            return
+        budgets.set(ctx.ledger_id, category, limit, items)
+    except (BudgetError, IndexError) as e:
+        reply(ctx.event, TextSendMessage(text=f"❌ {e}\n{BUDGET_USAGE}"))
         return
-
-    # ✅ 統計：快速日期（今天/昨天）
-    if text.startswith("統計 "):
+    usage = budgets.usage(ctx.ledger_id, ctx.ledger, ctx.now.strftime("%Y-%m"))
+    detail = f"（包含：{'、'.join(items)}）" if items else ""
+    reply(ctx.event, TextSendMessage(
+        text=f"✅ 已設定「{category}」每月預算 {limit} 元{detail}\n\n{format_usage(usage)}"
+    ))
+
+# 📬 定期摘要：訂閱 每日／訂閱 每週／取消訂閱 [每日|每週]，推播到目前的聊天室
+REPORT_KIND_OF = {label: kind for kind, label in REPORT_KINDS.items()}
+
+# 前綴帶空白，「訂閱費 150」這類記帳內容不會被攔下
+@router.command("訂閱", "取消訂閱")
+@router.prefix("訂閱 ", "取消訂閱 ")
+def subscribe_reports(ctx):
+    parts = ctx.text.split()
+    cancel = parts[0] == "取消訂閱"
+    if (len(parts) < 2 and not cancel) or (len(parts) > 1 and parts[1] not in REPORT_KIND_OF):
+        reply(ctx.event, TextSendMessage(text="格式：訂閱 每日／訂閱 每週／取消訂閱 [每日|每週]"))
+        return
+    kinds = [REPORT_KIND_OF[parts[1]]] if len(parts) > 1 else list(REPORT_KINDS)
+    value = settings.get(ctx.ledger_id)
+    reports = value.setdefault("reports", {})
+    for kind in kinds:
+        if cancel:
+            reports.pop(kind, None)
+        else:
+            reports[kind] = source_id_of(ctx.event.source)
+    settings.set(ctx.ledger_id, value)
+    labels = "、".join(REPORT_KINDS[k] for k in kinds)
+    reply(ctx.event, TextSendMessage(text=f"📬 已取消{labels}摘要" if cancel else f"📬 已訂閱{labels}摘要"))
+
+def send_reports(kind, when):
+    # 依訂閱推播摘要；內容全部來自帳本快取，一本帳失敗不影響其他帳本
+    build = daily_report if kind == "daily" else weekly_report
+    # 訂閱可能是在其他 worker 修改的，推播前先重新讀取
+    settings.refresh()
+    for ledger_id, value in settings.items():
+        target = value.get("reports", {}).get(kind)
+        if not target:
+            continue
         try:
-            date_str = to_dash_date(text.split()[1])
-            matched = filter_by_date(get_all_records(), date_str)
-            if not matched:
-                raise ValueError(f"{date_str} 沒有資料")
-            total = sum(int(r["金額"]) for r in matched)
-            per_item = {}
-            for r in matched:
-                name = r["項目"]
-                per_item[name] = per_item.get(name, 0) + int(r["金額"])
-            detail = "\n".join([f"{k}: {v}" for k, v in per_item.items()])
-            msg = f"📊 統計日期：{date_str}\n總金額：{total} 元\n\n明細：\n{detail}"
-            line_bot_api.reply_message(event.reply_token, TextSendMessage(text=msg))
-        except Exception as e:
-            line_bot_api.reply_message(event.reply_token, TextSendMessage(
-                text=f"❌ {e}\n請重新選擇要統計的日期：",
-                quick_reply=QuickReply(items=[
-                    QuickReplyButton(action=MessageAction(label="今天", text=f"統計 {today}")),
-                    QuickReplyButton(action=MessageAction(label="昨天", text=f"統計 {yesterday}")),
-                    QuickReplyButton(action=MessageAction(label="本月", text=f"統計月 {this_month}")),
-                    QuickReplyButton(action=MessageAction(label="上個月", text=f"統計月 {last_month}")),
-                    QuickReplyButton(action=MessageAction(label="自訂日期", text="統計 自訂")),
-                    QuickReplyButton(action=MessageAction(label="自訂年月", text="統計月 自訂"))
-                ])
-            ))
+            book = ledgers.get(ledger_id)
+            usage = budgets.usage(ledger_id, book.cache, when.strftime("%Y-%m"))
+            messenger.push(target, TextSendMessage(text=build(book.cache, when.date(), usage)))
+        except Exception:
+            logger.exception("推播%s摘要給帳本 %s 失敗", REPORT_KINDS[kind], ledger_id)
+
+# REPORT_DAILY_AT、REPORT_WEEKLY_AT、REPORT_WEEKLY_DAY 設定推播時間（台北時間）
+# 多個 uvicorn worker 時只有拿到 REPORT_LOCK_PATH 檔案鎖的那一個會推播
+report_scheduler = ReportScheduler(build_jobs(send_reports), pytz.timezone("Asia/Taipei"))
+
+# 📈 圖表：圖表 [202505]，當月各項目的圓餅圖與每天的長條圖（預設本月）
+# 圖在另一個行程畫好後放在 /charts 底下，LINE 需要公開的 https 網址，請設定 PUBLIC_BASE_URL
+chart_renderer = ChartRenderer()
+app.mount("/charts", StaticFiles(directory=chart_renderer.directory), name="charts")
+
+@router.command("圖表", needs=("ledger",))
+@router.prefix("圖表 ", needs=("ledger",))
+def chart(ctx):
+    base_url = os.getenv("PUBLIC_BASE_URL", "").rstrip("/")
+    if not base_url or not charts_available():
+        reply(ctx.event, TextSendMessage(text="❌ 圖表功能未啟用（需要安裝 matplotlib 並設定 PUBLIC_BASE_URL）"))
+        return
+    parts = ctx.text.split()
+    try:
+        month = datetime.strptime(parts[1], "%Y%m").strftime("%Y-%m") if len(parts) > 1 else ctx.now.strftime("%Y-%m")
+    except ValueError:
+        reply(ctx.event, TextSendMessage(text="❌ 格式：圖表 202505"))
         return
-    
-    # ✅ 統計月：快速月份（本月/上月）
-    if text.startswith("統計月 "):
+    version, summary, per_day = ctx.ledger.month_snapshot(month)
+    if summary is None:
+        reply(ctx.event, TextSendMessage(text=f"❌ {month} 沒有紀錄"))
+        return
+    total, per_item = summary
+    try:
+        with metrics.stage("chart"):
+            filename = chart_renderer.get(
+                (ctx.ledger_id, month), version, month, f"{month} 支出 {total} 元", per_item, per_day,
+                timeout=float(os.getenv("CHART_TIMEOUT", "20"))
+            )
+    except Exception as e:
+        logger.exception("畫圖失敗：%s %s", ctx.ledger_id, month)
+        reply(ctx.event, TextSendMessage(text=f"❌ 圖表產生失敗，請稍後再試（{type(e).__name__}）"))
+        return
+    url = f"{base_url}/charts/{filename}"
+    reply(ctx.event, ImageSendMessage(original_content_url=url, preview_image_url=url))
+
+@router.command("選單")
+def main_menu(ctx):
+    reply(ctx.event, FlexSendMessage(alt_text="請選擇操作功能", contents=get_main_menu()))
+
+def check_storage():
+    # 實際連一次儲存後端；還沒有帳本被開啟時檢查預設帳本
+    books = list(ledgers) or [ledgers.get(DEFAULT_LEDGER)]
+    results = {}
+    for book in books:
+        start = time.perf_counter()
         try:
-            month_str = text.split()[1]
-            if len(month_str) != 6 or not month_str.isdigit():
-                raise ValueError("格式錯誤，請輸入 6 碼年月（如 202505）")
-
-            year, month = month_str[:4], month_str[4:]
-            prefix = f"{year}-{month.zfill(2)}"
-            matched = [r for r in get_all_records() if r["日期"].startswith(prefix)]
-
-            if not matched:
-                raise ValueError(f"{prefix} 查無資料")
-
-            total = sum(int(r["金額"]) for r in matched)
-            per_item = {}
-            for r in matched:
-                name = r["項目"]
-                per_item[name] = per_item.get(name, 0) + int(r["金額"])
-            detail = "\n".join([f"{k}: {v}" for k, v in per_item.items()])
-            msg = f"📊 統計月份：{prefix}\n總金額：{total} 元\n\n明細：\n{detail}"
-
-            line_bot_api.reply_message(event.reply_token, TextSendMessage(text=msg))
+            book.storage.ping()
+            result = {"ok": True}
         except Exception as e:
-            # ⬇️ QuickReply 選單重新出現
-            today = now.strftime("%Y%m%d")
-            yesterday = (now - timedelta(days=1)).strftime("%Y%m%d")
-            this_month = now.strftime("%Y%m")
-            last_month = (now.replace(day=1) - timedelta(days=1)).strftime("%Y%m")
-            line_bot_api.reply_message(event.reply_token, TextSendMessage(
-                text=f"❌ {e}\n請重新選擇要統計的月份：",
-                quick_reply=QuickReply(items=[
-                    QuickReplyButton(action=MessageAction(label="今天", text=f"統計 {today}")),
-                    QuickReplyButton(action=MessageAction(label="昨天", text=f"統計 {yesterday}")),
-                    QuickReplyButton(action=MessageAction(label="本月", text=f"統計月 {this_month}")),
-                    QuickReplyButton(action=MessageAction(label="上個月", text=f"統計月 {last_month}")),
-                    QuickReplyButton(action=MessageAction(label="自訂日期", text="統計 自訂")),
-                    QuickReplyButton(action=MessageAction(label="自訂年月", text="統計月 自訂"))
-                ])
-            ))
-        return
-
-    if text == "選單":
-        line_bot_api.reply_message(event.reply_token, FlexSendMessage(alt_text="請選擇操作功能", contents=get_main_menu()))
+            result = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        result["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        result["cache_age_seconds"] = book.cache.stats()["age_seconds"]
+        results[book.id] = result
+    return results
 
 @app.get("/health")
-async def health_check():
-    return {"status": "ok"}
\ No newline at end of file
+async def health_check(deep: bool = False):
+    # /health?deep=1 會實際檢查儲存後端是否連得上，並回報各帳本快取的年齡
+    status = {"status": "ok", "ledgers": ledgers.stats(), "webhook": dispatcher.stats(), "user_state": user_state.stats(), "flex_bubble_cache": bubble_cache_info(), "line_api": messenger.stats(),
+              "startup": {**startup, "spreadsheet": spreadsheet.stats(), "google_token": token_refresher.stats()},
+              "settings": settings.stats(), "budget_alerts": budgets.alerts, "reports": report_scheduler.stats(),
+              "charts": chart_renderer.stats()}
+    if not deep:
+        return status
+    try:
+        status["storage"] = await run_in_threadpool(check_storage)
+    except Exception as e:
+        status["storage"] = {"error": f"{type(e).__name__}: {e}"}
+    if "error" in status["storage"] or not all(r["ok"] for r in status["storage"].values()):
+        status["status"] = "degraded"
+        return JSONResponse(status, status_code=503)
+    return status
+
+def cache_ages():
+    ages = [book.cache.stats()["age_seconds"] for book in ledgers]
+    ages = [a for a in ages if a is not None]
+    return max(ages) if ages else None
+
+metrics.REGISTRY.gauge("linebot_webhook_queue_depth", "等待處理的 webhook 事件數", lambda: dispatcher.stats()["queue_depth"])
+metrics.REGISTRY.gauge("linebot_ledgers_open", "已開啟的帳本數", lambda: ledgers.stats()["ledgers"])
+metrics.REGISTRY.counter_fn(
+    "linebot_ledger_cache_requests_total", "帳本快取命中／未命中次數",
+    lambda: {("hit",): ledgers.stats()["cache_hits"], ("miss",): ledgers.stats()["cache_misses"]}, ("result",)
+)
+metrics.REGISTRY.gauge("linebot_ledger_cache_max_age_seconds", "最久未重新載入的帳本快取年齡", cache_ages)
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+def check_admin(request):
+    # 管理端點需設定 ADMIN_TOKEN，並在 X-Admin-Token 標頭帶入相同的值
+    token = os.getenv("ADMIN_TOKEN")
+    if not token or not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), token):
+        raise HTTPException(status_code=403, detail="forbidden")
+
+@app.get("/admin/export")
+async def admin_export(request: Request, ledger: str = DEFAULT_LEDGER, format: str = "csv"):
+    check_admin(request)
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format 必須是 {', '.join(FORMATS)}")
+    book = await run_in_threadpool(ledgers.get, ledger)
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        export_lines(book.storage, format),
+        media_type=f"{media_type}; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{ledger}.{format}"'}
+    )
+
+@app.post("/admin/import")
+async def admin_import(request: Request, ledger: str = DEFAULT_LEDGER, format: str = "csv", dry_run: bool = False):
+    check_admin(request)
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format 必須是 {', '.join(FORMATS)}")
+    # 上傳內容先串流寫入暫存檔（小檔留在記憶體），再於背景執行緒分批驗證與寫入
+    spool = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    async for chunk in request.stream():
+        spool.write(chunk)
+    spool.seek(0)
+    book = await run_in_threadpool(ledgers.get, ledger)
+    lines = io.TextIOWrapper(spool, encoding="utf-8-sig", newline="")
+    try:
+        return await run_in_threadpool(import_lines, book.storage, lines, format, dry_run=dry_run)
+    finally:
+        lines.close()
+
+startup = {"warm_ms": None, "warmed": [], "error": None}
+
+def warm_up(ledger_ids=None):
+    # 先連上試算表、載入常用帳本的快取，第一個進來的使用者就不必等
+    # WARM_LEDGERS 以逗號分隔要預先載入的帳本，預設只有 sheet1 的預設帳本
+    if ledger_ids is None:
+        ledger_ids = [i.strip() for i in os.getenv("WARM_LEDGERS", DEFAULT_LEDGER).split(",") if i.strip()]
+    start = time.perf_counter()
+    try:
+        if "sheets" in os.getenv("LEDGER_BACKEND", "sheets"):
+            spreadsheet.get()
+        for ledger_id in ledger_ids:
+            ledgers.get(ledger_id).cache.records()
+            startup["warmed"].append(ledger_id)
+    except Exception as e:
+        startup["error"] = f"{type(e).__name__}: {e}"
+        logger.exception("啟動預熱失敗，改在第一次使用時再連線")
+    startup["warm_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+@app.on_event("startup")
+def start_warm_up():
+    # 在背景預熱，不拖慢啟動；WARM_ON_STARTUP=0 可關閉
+    if os.getenv("WARM_ON_STARTUP", "1") != "0":
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+@app.on_event("startup")
+def start_report_scheduler():
+    report_scheduler.start()
+
+@app.on_event("shutdown")
+def shutdown_dispatcher():
+    dispatcher.shutdown()
+    token_refresher.stop()
+    report_scheduler.stop()
+    chart_renderer.shutdown()
\ No newline at end of file
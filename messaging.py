@@ -0,0 +1,142 @@
+import logging
+import os
+import threading
+import time
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+from linebot import LineBotApi
+from linebot.exceptions import LineBotApiError
+from linebot.http_client import RequestsHttpClient, RequestsHttpResponse
+
+from metrics import instrument
+
+logger = logging.getLogger(__name__)
+
+# reply token 約一分鐘後失效，留一點緩衝
+REPLY_TOKEN_TTL = float(os.getenv("LINE_REPLY_TOKEN_TTL", "50"))
+
+
+class PooledHttpClient(RequestsHttpClient):
+    # 與 LINE API 共用 keep-alive 連線池，不必每次呼叫都重新建立 TLS 連線
+    def __init__(self, timeout=RequestsHttpClient.DEFAULT_TIMEOUT, pool_size=None):
+        super().__init__(timeout=timeout)
+        if pool_size is None:
+            pool_size = int(os.getenv("LINE_HTTP_POOL_SIZE", "20"))
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, url, headers=None, params=None, stream=False, timeout=None):
+        response = self.session.get(
+            url, headers=headers, params=params, stream=stream, timeout=timeout or self.timeout
+        )
+        return RequestsHttpResponse(response)
+
+    def post(self, url, headers=None, data=None, timeout=None):
+        response = self.session.post(url, headers=headers, data=data, timeout=timeout or self.timeout)
+        return RequestsHttpResponse(response)
+
+    def put(self, url, headers=None, data=None, timeout=None):
+        response = self.session.put(url, headers=headers, data=data, timeout=timeout or self.timeout)
+        return RequestsHttpResponse(response)
+
+    def delete(self, url, headers=None, data=None, timeout=None):
+        response = self.session.delete(url, headers=headers, data=data, timeout=timeout or self.timeout)
+        return RequestsHttpResponse(response)
+
+
+def build_line_bot_api(channel_access_token):
+    # LINE_API_ENDPOINT 可指到本機的 mock server 做離線壓測
+    kwargs = {"http_client": PooledHttpClient}
+    timeout = os.getenv("LINE_API_TIMEOUT")
+    if timeout:
+        kwargs["timeout"] = float(timeout)
+    endpoint = os.getenv("LINE_API_ENDPOINT")
+    if endpoint:
+        kwargs["endpoint"] = endpoint
+    return LineBotApi(channel_access_token, **kwargs)
+
+
+def source_id_of(source):
+    return getattr(source, "group_id", None) or getattr(source, "room_id", None) or getattr(source, "user_id", None)
+
+
+def _is_invalid_reply_token(e):
+    message = getattr(getattr(e, "error", None), "message", "") or ""
+    return e.status_code == 400 and "reply token" in message.lower()
+
+
+class Messenger:
+    # 對外送訊息的統一出口：
+    # - 429 / 5xx / 連線錯誤時以指數退避重試，次數有上限
+    # - reply token 已過期（處理太久）時改用 push 送給同一個使用者／群組
+    # - 在 webhook 的工作執行緒中同步呼叫，不會卡住 asyncio 事件迴圈
+    def __init__(self, api, max_retries=None, backoff=None):
+        self.api = instrument(api, "line")
+        self.max_retries = int(os.getenv("LINE_MAX_RETRIES", "3")) if max_retries is None else max_retries
+        self.backoff = float(os.getenv("LINE_RETRY_BACKOFF", "0.5")) if backoff is None else backoff
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.retries = 0
+        self.push_fallbacks = 0
+        self.failures = 0
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _call(self, func, *args, **kwargs):
+        # 失敗次數由 push / reply 在最後一次嘗試（含 push 備援）仍失敗時才計入
+        for attempt in range(self.max_retries + 1):
+            try:
+                result = func(*args, **kwargs)
+                self._count("sent")
+                return result
+            except LineBotApiError as e:
+                if not (e.status_code == 429 or e.status_code >= 500) or attempt == self.max_retries:
+                    raise
+                delay = float((e.headers or {}).get("Retry-After") or self.backoff * 2 ** attempt)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff * 2 ** attempt
+            self._count("retries")
+            time.sleep(delay)
+
+    def push(self, to, messages):
+        # 同一個 retry key 讓 LINE 端不會因重試而重複送出
+        try:
+            return self._call(self.api.push_message, to, messages, retry_key=str(uuid.uuid4()))
+        except Exception:
+            self._count("failures")
+            raise
+
+    def reply(self, event, messages):
+        timestamp = getattr(event, "timestamp", None)
+        if timestamp and time.time() - timestamp / 1000 > REPLY_TOKEN_TTL:
+            self._count("push_fallbacks")
+            return self.push(source_id_of(event.source), messages)
+        try:
+            return self._call(self.api.reply_message, event.reply_token, messages)
+        except (requests.ConnectionError, requests.Timeout):
+            self._count("failures")
+            raise
+        except LineBotApiError as e:
+            if not _is_invalid_reply_token(e):
+                self._count("failures")
+                raise
+            logger.warning("reply token 已失效，改用 push 送出")
+            self._count("push_fallbacks")
+            return self.push(source_id_of(event.source), messages)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sent": self.sent,
+                "retries": self.retries,
+                "push_fallbacks": self.push_fallbacks,
+                "failures": self.failures,
+            }
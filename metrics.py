@@ -0,0 +1,235 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# 不依賴 prometheus_client 的輕量指標，/metrics 以 Prometheus 文字格式輸出
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield self.name, _format_labels(self.labels, labels), value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # labels → [各 bucket 計數..., 總和, 次數]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            data = self._values.get(labels)
+            if data is None:
+                data = self._values[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+                    break
+            data[-2] += value
+            data[-1] += 1
+
+    def snapshot(self, *labels):
+        # 回傳 (次數, 總和, {上界: 累計次數})
+        with self._lock:
+            data = list(self._values.get(labels) or [0] * len(self.buckets) + [0.0, 0])
+        cumulative = {}
+        running = 0
+        for bound, n in zip(self.buckets, data):
+            running += n
+            cumulative[bound] = running
+        return data[-1], data[-2], cumulative
+
+    def samples(self):
+        with self._lock:
+            keys = sorted(self._values)
+        for labels in keys:
+            count, total, cumulative = self.snapshot(*labels)
+            for bound, n in cumulative.items():
+                yield f"{self.name}_bucket", _format_labels(self.labels, labels, [("le", _format_value(bound))]), n
+            yield f"{self.name}_sum", _format_labels(self.labels, labels), round(total, 6)
+            yield f"{self.name}_count", _format_labels(self.labels, labels), count
+
+
+class Gauge:
+    # 值在輸出時才向 fn 取得；fn 回傳數字，或 {標籤值 tuple: 數字}
+    kind = "gauge"
+
+    def __init__(self, name, help, fn, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.fn = fn
+
+    def samples(self):
+        value = self.fn()
+        if not isinstance(value, dict):
+            value = {(): value}
+        for labels, v in sorted(value.items()):
+            if v is not None:
+                yield self.name, _format_labels(self.labels, labels), v
+
+
+class CounterFunc(Gauge):
+    # 和 Gauge 一樣在輸出時取值，但值只會遞增（例如其他元件自己累計的次數），以 counter 輸出才能用 rate()
+    kind = "counter"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, fn, labels=()):
+        return self.register(Gauge(name, help, fn, labels))
+
+    def counter_fn(self, name, help, fn, labels=()):
+        return self.register(CounterFunc(name, help, fn, labels))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "linebot_stage_seconds", "各處理階段耗時（簽章驗證、載入快取、統計等）", ("stage",)
+)
+API_SECONDS = REGISTRY.histogram(
+    "linebot_api_call_seconds", "對外 API 呼叫耗時（Google Sheets、LINE）", ("api", "method")
+)
+API_ERRORS = REGISTRY.counter("linebot_api_errors_total", "對外 API 呼叫失敗次數", ("api", "method"))
+HANDLER_SECONDS = REGISTRY.histogram("linebot_handler_seconds", "指令處理函式耗時", ("handler",))
+HANDLER_ERRORS = REGISTRY.counter("linebot_handler_errors_total", "指令處理函式丟出例外的次數", ("handler",))
+EVENTS = REGISTRY.counter("linebot_events_total", "處理完成的 webhook 事件數", ("result",))
+API_CALLS_PER_EVENT = REGISTRY.histogram(
+    "linebot_api_calls_per_event", "每個事件在處理執行緒上發出的 API 呼叫數", ("api",),
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21),
+)
+
+# 目前這個執行緒正在處理的事件的 API 呼叫計數
+_event = threading.local()
+
+
+@contextmanager
+def timed(histogram, *labels, errors=None):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        if errors is not None:
+            errors.inc(*labels)
+        raise
+    finally:
+        histogram.observe(time.perf_counter() - start, *labels)
+
+
+def stage(name):
+    return timed(STAGE_SECONDS, name)
+
+
+@contextmanager
+def event_scope(apis=("sheets", "line")):
+    # 包住一個 webhook 事件的處理，結束時記錄各 API 的呼叫次數
+    _event.calls = dict.fromkeys(apis, 0)
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        calls, _event.calls = _event.calls, None
+        EVENTS.inc("ok" if ok else "error")
+        for api, n in calls.items():
+            API_CALLS_PER_EVENT.observe(n, api)
+
+
+def _count_call(api):
+    calls = getattr(_event, "calls", None)
+    if calls is not None:
+        calls[api] = calls.get(api, 0) + 1
+
+
+class Instrumented:
+    # 包住 gspread Worksheet 或 LineBotApi，所有方法呼叫都計時、計次並記錄錯誤
+    def __init__(self, target, api):
+        self._target = target
+        self._api = api
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr) or name.startswith("_"):
+            return attr
+        api = self._api
+
+        def call(*args, **kwargs):
+            _count_call(api)
+            with timed(API_SECONDS, api, name, errors=API_ERRORS):
+                return attr(*args, **kwargs)
+        return call
+
+
+def instrument(target, api):
+    if target is None or isinstance(target, Instrumented):
+        return target
+    return Instrumented(target, api)
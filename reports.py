@@ -0,0 +1,148 @@
+import logging
+import os
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+from aggregates import week_range
+from budgets import format_usage
+
+logger = logging.getLogger(__name__)
+
+# 定期摘要：內容全部由帳本快取的每日／每月累計組成，不需要重新讀取整張表
+REPORT_KINDS = {"daily": "每日", "weekly": "每週"}
+
+
+def _top_items(per_item, limit=5):
+    ranked = sorted(per_item.items(), key=lambda kv: -kv[1])[:limit]
+    return "\n".join(f"{name}: {amount}" for name, amount in ranked)
+
+
+def daily_report(cache, day, budget_usage=()):
+    summary = cache.summary("day", day.strftime("%Y-%m-%d"))
+    lines = [f"📅 每日摘要：{day:%Y-%m-%d}"]
+    if summary is None:
+        lines.append("今天沒有記帳")
+    else:
+        total, per_item = summary
+        lines += [f"總金額：{total} 元", "", _top_items(per_item)]
+    month = cache.summary("month", day.strftime("%Y-%m"))
+    lines += ["", f"本月累計：{month[0] if month else 0} 元"]
+    if budget_usage:
+        lines += ["", "💰 本月預算", format_usage(budget_usage)]
+    return "\n".join(lines)
+
+
+def weekly_report(cache, day, budget_usage=()):
+    start, end = week_range(day)
+    summary = cache.summary("week", day)
+    previous = cache.summary("week", day - timedelta(days=7))
+    lines = [f"🗓️ 每週摘要：{start} ~ {end}"]
+    if summary is None:
+        lines.append("這週沒有記帳")
+    else:
+        total, per_item = summary
+        lines.append(f"總金額：{total} 元（平均每天 {round(total / 7)} 元）")
+        if previous and previous[0]:
+            change = round((total - previous[0]) * 100 / previous[0])
+            lines.append(f"比上週{'多' if change >= 0 else '少'} {abs(change)}%")
+        lines += ["", _top_items(per_item)]
+    if budget_usage:
+        lines += ["", "💰 本月預算", format_usage(budget_usage)]
+    return "\n".join(lines)
+
+
+def parse_clock(value):
+    # "21:00" → (21, 0)
+    hour, minute = value.split(":")
+    return int(hour), int(minute)
+
+
+def next_daily(now, at):
+    hour, minute = at
+    run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    return run if run > now else run + timedelta(days=1)
+
+
+def next_weekly(now, weekday, at):
+    # weekday：週一為 0
+    run = next_daily(now, at)
+    return run + timedelta(days=(weekday - run.weekday()) % 7)
+
+
+def _try_lock(path):
+    # 非阻塞地取得檔案鎖，成功時回傳要一直開著的檔案；沒有 fcntl（Windows）時直接視為取得
+    try:
+        import fcntl
+    except ImportError:
+        return open(path, "a")
+    f = open(path, "a")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+class ReportScheduler:
+    # 單一背景執行緒依序執行到期的排程；jobs 為 [(名稱, next_run(now), run(now)), ...]
+    # 多個 uvicorn worker 都會啟動排程，但只有拿到檔案鎖的那一個真的推播，其餘每分鐘再試一次，
+    # 持有鎖的 worker 結束時由其他 worker 接手（REPORT_LOCK_PATH，跨機器部署時只在一台上開啟推播）
+    def __init__(self, jobs, tz, lock_path=None):
+        self.jobs = jobs
+        self.tz = tz
+        self.lock_path = lock_path or os.getenv("REPORT_LOCK_PATH") or os.path.join(tempfile.gettempdir(), "linebot-reports.lock")
+        self._lock_file = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.runs = {}
+        self.errors = 0
+
+    def start(self):
+        if self._thread is None and self.jobs:
+            self._thread = threading.Thread(target=self._run, name="report-scheduler", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while self._lock_file is None:
+            self._lock_file = _try_lock(self.lock_path)
+            if self._lock_file is None and self._stop.wait(60):
+                return
+        schedule = {name: next_run(datetime.now(self.tz)) for name, next_run, _ in self.jobs}
+        while True:
+            name = min(schedule, key=schedule.get)
+            delay = (schedule[name] - datetime.now(self.tz)).total_seconds()
+            if self._stop.wait(max(0.0, delay)):
+                return
+            for job_name, next_run, run in self.jobs:
+                if job_name == name:
+                    try:
+                        run(schedule[name])
+                        self.runs[name] = self.runs.get(name, 0) + 1
+                    except Exception:
+                        self.errors += 1
+                        logger.exception("定期摘要 %s 執行失敗", name)
+                    schedule[name] = next_run(schedule[name] + timedelta(seconds=1))
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {"jobs": [name for name, _, _ in self.jobs], "active": self._lock_file is not None, "runs": dict(self.runs), "errors": self.errors}
+
+
+def build_jobs(send_reports):
+    # REPORT_DAILY_AT：每日摘要時間（預設 21:00，設為空字串關閉）
+    # REPORT_WEEKLY_AT、REPORT_WEEKLY_DAY：每週摘要時間與星期（1 = 週一 … 7 = 週日，預設週日 21:00）
+    jobs = []
+    daily_at = os.getenv("REPORT_DAILY_AT", "21:00")
+    if daily_at:
+        at = parse_clock(daily_at)
+        jobs.append(("daily", lambda now, at=at: next_daily(now, at), lambda when: send_reports("daily", when)))
+    weekly_at = os.getenv("REPORT_WEEKLY_AT", "21:00")
+    if weekly_at:
+        at = parse_clock(weekly_at)
+        weekday = int(os.getenv("REPORT_WEEKLY_DAY", "7")) - 1
+        jobs.append(("weekly", lambda now, at=at: next_weekly(now, weekday, at), lambda when: send_reports("weekly", when)))
+    return jobs
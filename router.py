@@ -0,0 +1,110 @@
+from metrics import HANDLER_ERRORS, HANDLER_SECONDS, stage, timed
+
+
+class Context:
+    # 一則訊息的處理環境。帳本與紀錄都是第一次用到時才載入，
+    # 像「選單」「查詢」這類只回覆選項的指令完全不會碰到儲存層。
+    def __init__(self, event, text, now, ledger_id, open_ledger, state_store, state_key):
+        self.event = event
+        self.text = text
+        self.now = now
+        self.ledger_id = ledger_id
+        self._open_ledger = open_ledger
+        self._book = None
+        self.state_store = state_store
+        self.state_key = state_key
+        self.state = state_store.get(state_key) or {}
+
+    @property
+    def step(self):
+        return self.state.get("step")
+
+    @property
+    def book(self):
+        if self._book is None:
+            self._book = self._open_ledger(self.ledger_id)
+        return self._book
+
+    @property
+    def ledger(self):
+        return self.book.cache
+
+    @property
+    def storage(self):
+        return self.book.storage
+
+    @property
+    def records(self):
+        return self.book.cache.records()
+
+    def load(self, needs):
+        # 依處理函式宣告的需求預先載入
+        if "ledger" in needs:
+            self.book
+        if "records" in needs:
+            self.records
+
+    def set_state(self, value):
+        self.state = dict(value)
+        self.state_store.set(self.state_key, self.state)
+
+    def clear_state(self):
+        self.state = {}
+        self.state_store.delete(self.state_key)
+
+
+class CommandRouter:
+    # 指令分派表：
+    #   1. 完全相符的指令（可限定只在某個對話步驟有效）
+    #   2. 前綴指令，較長的前綴優先
+    #   3. 目前對話步驟的處理函式
+    # 每個處理函式以 needs 宣告要用到的資料（"ledger"、"records"）
+    def __init__(self):
+        self.exact = {}
+        self.prefixes = []
+        self.steps = {}
+
+    def command(self, *texts, step=None, needs=()):
+        def decorator(func):
+            for text in texts:
+                self.exact.setdefault(text, {})[step] = (func, needs)
+            return func
+        return decorator
+
+    def prefix(self, *prefixes, needs=()):
+        def decorator(func):
+            for p in prefixes:
+                self.prefixes.append((p, func, needs))
+            self.prefixes.sort(key=lambda entry: -len(entry[0]))
+            return func
+        return decorator
+
+    def step(self, *steps, needs=()):
+        def decorator(func):
+            for s in steps:
+                self.steps[s] = (func, needs)
+            return func
+        return decorator
+
+    def resolve(self, text, step):
+        # 回傳 (處理函式, needs)；沒有對應的指令時回傳 None
+        by_step = self.exact.get(text)
+        if by_step:
+            entry = by_step.get(step) or by_step.get(None)
+            if entry:
+                return entry
+        for p, func, needs in self.prefixes:
+            if text.startswith(p):
+                return func, needs
+        return self.steps.get(step)
+
+    def dispatch(self, ctx):
+        entry = self.resolve(ctx.text, ctx.step)
+        if entry is None:
+            return False
+        func, needs = entry
+        with stage("load"):
+            ctx.load(needs)
+        with timed(HANDLER_SECONDS, func.__name__, errors=HANDLER_ERRORS):
+            func(ctx)
+        return True
@@ -0,0 +1,138 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from sheet_writer import first_row_of
+
+
+# 各帳本的長期設定（預算、定期摘要的訂閱），每本帳一份 dict。
+# 設定量很小：第一次用到時整份載入記憶體，之後讀取不碰後端，修改時寫回該帳本那一份。
+# 多個 worker 各有一份記憶體副本，超過 SETTINGS_TTL 秒就重新載入，看得到其他 worker 的修改。
+class SettingsStore:
+    def __init__(self, ttl=None):
+        if ttl is None:
+            ttl = float(os.getenv("SETTINGS_TTL", "60"))
+        self.ttl = ttl
+        self._data = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _load_all(self):
+        raise NotImplementedError
+
+    def _save(self, ledger_id, value):
+        raise NotImplementedError
+
+    def _ensure_loaded(self):
+        if self._data is None or (self.ttl > 0 and time.monotonic() - self._loaded_at > self.ttl):
+            self._data = self._load_all()
+            self._loaded_at = time.monotonic()
+
+    def refresh(self):
+        with self._lock:
+            self._data = None
+            self._ensure_loaded()
+
+    def get(self, ledger_id):
+        with self._lock:
+            self._ensure_loaded()
+            return json.loads(json.dumps(self._data.get(ledger_id, {})))
+
+    def set(self, ledger_id, value):
+        with self._lock:
+            self._ensure_loaded()
+            self._save(ledger_id, value)
+            self._data[ledger_id] = json.loads(json.dumps(value))
+
+    def items(self):
+        with self._lock:
+            self._ensure_loaded()
+            return [(ledger_id, json.loads(json.dumps(value))) for ledger_id, value in self._data.items()]
+
+    def stats(self):
+        with self._lock:
+            return {"backend": self.name, "ledgers": len(self._data) if self._data is not None else None}
+
+
+class MemorySettingsStore(SettingsStore):
+    name = "memory"
+
+    def __init__(self):
+        # 只存在記憶體，不需要重新載入
+        super().__init__(ttl=0)
+
+    def refresh(self):
+        pass
+
+    def _load_all(self):
+        return {}
+
+    def _save(self, ledger_id, value):
+        pass
+
+
+class SQLiteSettingsStore(SettingsStore):
+    name = "sqlite"
+
+    def __init__(self, path=None, ttl=None):
+        super().__init__(ttl)
+        self.path = path or os.getenv("SETTINGS_SQLITE_PATH") or os.getenv("SQLITE_PATH", "ledger.db")
+        self._conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS ledger_settings (ledger TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def _load_all(self):
+        return {ledger_id: json.loads(value) for ledger_id, value in self._conn.execute("SELECT ledger, value FROM ledger_settings")}
+
+    def _save(self, ledger_id, value):
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ledger_settings (ledger, value) VALUES (?, ?)",
+                (ledger_id, json.dumps(value, ensure_ascii=False)),
+            )
+
+
+class SheetSettingsStore(SettingsStore):
+    # 存在試算表的「設定」工作表：A 欄帳本、B 欄 JSON
+    name = "sheets"
+
+    def __init__(self, open_sheet, ttl=None):
+        super().__init__(ttl)
+        self._open_sheet = open_sheet
+        self._sheet = None
+        self._row_of = {}
+
+    def _load_all(self):
+        self._sheet = self._open_sheet()
+        self._row_of = {}
+        data = {}
+        for i, row in enumerate(self._sheet.get("A2:B"), start=2):
+            if len(row) >= 2 and row[0]:
+                data[row[0]] = json.loads(row[1])
+                self._row_of[row[0]] = i
+        return data
+
+    def _save(self, ledger_id, value):
+        row = [ledger_id, json.dumps(value, ensure_ascii=False)]
+        sheet_row = self._row_of.get(ledger_id)
+        if sheet_row is None:
+            self._row_of[ledger_id] = first_row_of(self._sheet.append_row(row))
+        else:
+            self._sheet.update(range_name=f"A{sheet_row}:B{sheet_row}", values=[row])
+
+
+def build_settings_store(open_sheet, backend=None):
+    # SETTINGS_BACKEND：sheets、sqlite、memory；未指定時跟著 LEDGER_BACKEND，
+    # 資料在試算表就存在「設定」工作表，用 SQLite 就存在同一個資料庫
+    backend = backend or os.getenv("SETTINGS_BACKEND")
+    if not backend:
+        backend = "sheets" if os.getenv("LEDGER_BACKEND", "sheets") == "sheets" else "sqlite"
+    if backend == "sheets":
+        return SheetSettingsStore(open_sheet)
+    if backend == "sqlite":
+        return SQLiteSettingsStore()
+    if backend == "memory":
+        return MemorySettingsStore()
+    raise ValueError(f"未知的 SETTINGS_BACKEND：{backend}")
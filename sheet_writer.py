@@ -0,0 +1,102 @@
+import logging
+import os
+import re
+import threading
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+_RANGE_ROW = re.compile(r"![A-Z]+(\d+)")
+
+
+def first_row_of(response):
+    # append 回傳的 updatedRange 形如 "'工作表1'!A12:D14"，取出起始列號
+    updated = (response or {}).get("updates", {}).get("updatedRange", "")
+    m = _RANGE_ROW.search(updated)
+    if not m:
+        raise ValueError(f"無法從 append 回應取得列號：{updated!r}")
+    return int(m.group(1))
+
+
+def col_letter(col):
+    letters = ""
+    while col:
+        col, rem = divmod(col - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+class SheetWriter:
+    # 寫入管線：
+    # - append 直接由 API 回應取得列號，不再回頭讀整張表
+    # - 修改一整列只送一次範圍更新
+    # - batch_ms > 0 時，把這段時間內所有使用者的新增合併成一次 append_rows
+    def __init__(self, sheet, on_append=None, batch_ms=None):
+        if batch_ms is None:
+            batch_ms = int(os.getenv("SHEET_APPEND_BATCH_MS", "0"))
+        self.sheet = sheet
+        self.on_append = on_append
+        self.batch_ms = batch_ms
+        self._pending = []
+        self._lock = threading.Lock()
+        self._timer = None
+        self.api_calls = 0
+        self.batches = 0
+
+    def append(self, row):
+        return self.append_many([row])[0]
+
+    def append_many(self, rows):
+        # 回傳每一列在試算表中的實際列號
+        if self.batch_ms <= 0:
+            return self._write(rows)
+        future = Future()
+        with self._lock:
+            self._pending.append((rows, future))
+            if self._timer is None:
+                self._timer = threading.Timer(self.batch_ms / 1000, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        return future.result()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._timer = None
+        if not pending:
+            return
+        rows = [row for batch, _ in pending for row in batch]
+        try:
+            numbers = self._write(rows)
+        except Exception as e:
+            for _, future in pending:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        offset = 0
+        for batch, future in pending:
+            future.set_result(numbers[offset:offset + len(batch)])
+            offset += len(batch)
+
+    def _write(self, rows):
+        with self._lock:
+            self.api_calls += 1
+        if len(rows) == 1:
+            response = self.sheet.append_row(rows[0])
+        else:
+            response = self.sheet.append_rows(rows)
+        start = first_row_of(response)
+        if self.on_append:
+            for row in rows:
+                self.on_append(row)
+        return [start + i for i in range(len(rows))]
+
+    def update_row(self, sheet_row, values, start_col=1):
+        end_col = start_col + len(values) - 1
+        range_name = f"{col_letter(start_col)}{sheet_row}:{col_letter(end_col)}{sheet_row}"
+        with self._lock:
+            self.api_calls += 1
+        self.sheet.update(range_name=range_name, values=[list(values)])
+
+    def stats(self):
+        return {"api_calls": self.api_calls, "batches": self.batches, "batch_ms": self.batch_ms}
@@ -0,0 +1,123 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+
+class LazySpreadsheet:
+    # 試算表第一次用到時才授權並開啟（OAuth 與 Drive 查詢不在 import 或啟動時進行）。
+    # 多個執行緒同時要用時只會連線一次；連線失敗則下一次再試，不會讓整個程式起不來。
+    def __init__(self, connect):
+        self._connect = connect
+        self._spreadsheet = None
+        self._lock = threading.Lock()
+        self.connect_seconds = None
+        self.failures = 0
+
+    def get(self):
+        spreadsheet = self._spreadsheet
+        if spreadsheet is not None:
+            return spreadsheet
+        with self._lock:
+            if self._spreadsheet is None:
+                start = time.perf_counter()
+                try:
+                    self._spreadsheet = self._connect()
+                except Exception:
+                    self.failures += 1
+                    raise
+                self.connect_seconds = time.perf_counter() - start
+            return self._spreadsheet
+
+    def set(self, spreadsheet):
+        # 直接換上已開好的試算表（壓測時換成假的試算表）
+        with self._lock:
+            self._spreadsheet = spreadsheet
+
+    @property
+    def ready(self):
+        return self._spreadsheet is not None
+
+    def stats(self):
+        return {
+            "connected": self.ready,
+            "connect_ms": round(self.connect_seconds * 1000, 1) if self.connect_seconds is not None else None,
+            "failures": self.failures,
+        }
+
+
+def credentials_of(client):
+    # gspread 5 放在 client.auth，gspread 6 放在 client.http_client.auth
+    auth = getattr(client, "auth", None)
+    if auth is None:
+        auth = getattr(getattr(client, "http_client", None), "auth", None)
+    return auth
+
+
+class TokenRefresher:
+    # 在 access token 到期前由背景執行緒先換新，請求執行緒不必停下來等 OAuth
+    def __init__(self, margin=None):
+        if margin is None:
+            margin = float(os.getenv("GOOGLE_TOKEN_REFRESH_MARGIN", "300"))
+        self.margin = margin
+        self._credentials = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.refreshes = 0
+        self.errors = 0
+        self.last_refresh = None
+
+    def watch(self, credentials):
+        if credentials is None or not hasattr(credentials, "refresh"):
+            return
+        with self._lock:
+            self._credentials = credentials
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="token-refresh", daemon=True)
+                self._thread.start()
+
+    def _next_delay(self):
+        credentials = self._credentials
+        expiry = getattr(credentials, "expiry", None)
+        if not getattr(credentials, "token", None):
+            # 還沒有 token：馬上先換一張
+            return 0
+        if expiry is None:
+            return self.margin
+        now = datetime.now(timezone.utc)
+        if expiry.tzinfo is None:
+            # google-auth 的 expiry 是不帶時區的 UTC 時間
+            now = now.replace(tzinfo=None)
+        return max(0.0, (expiry - now).total_seconds() - self.margin)
+
+    def _refresh(self):
+        from google.auth.transport.requests import Request
+
+        self._credentials.refresh(Request())
+
+    def _run(self):
+        while not self._stop.wait(self._next_delay()):
+            try:
+                self._refresh()
+                self.refreshes += 1
+                self.last_refresh = time.time()
+            except Exception:
+                self.errors += 1
+                logger.exception("Google access token 更新失敗，稍後重試")
+                if self._stop.wait(30):
+                    return
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {
+            "watching": self._credentials is not None,
+            "refreshes": self.refreshes,
+            "errors": self.errors,
+            "next_refresh_in": round(self._next_delay(), 1) if self._credentials is not None else None,
+        }
@@ -0,0 +1,149 @@
+import heapq
+
+# 分帳資料記在備註欄，格式：「[分帳] 小明付 小明=300,小華=300,小美=300」
+# 這樣分帳紀錄跟一般記帳共用同一張表、同一套快取，重新載入時也能還原餘額
+SPLIT_TAG = "[分帳]"
+
+
+class SplitError(ValueError):
+    pass
+
+
+def _check_name(name):
+    if not name or any(c in name for c in "=*,"):
+        raise SplitError(f"成員名稱不能包含 = * ,：{name}")
+    return name
+
+
+def parse_shares(amount, specs):
+    # specs 三種寫法（不可混用）：
+    #   平均分攤：小明 小華 小美
+    #   依比例：  小明*2 小華*1
+    #   指定金額：小明=300 小華=600（總和須等於金額）
+    if not specs:
+        raise SplitError("請至少指定一位分攤成員")
+    if all("=" in s for s in specs):
+        shares = {}
+        for s in specs:
+            name, value = s.split("=", 1)
+            if int(value) < 0:
+                raise SplitError(f"{name} 的金額不能是負數")
+            shares[_check_name(name)] = shares.get(name, 0) + int(value)
+        if sum(shares.values()) != amount:
+            raise SplitError(f"指定金額合計 {sum(shares.values())} 元，與總金額 {amount} 元不符")
+        return shares
+    if any("=" in s for s in specs):
+        raise SplitError("指定金額時，每位成員都要寫成 名字=金額")
+    weights = {}
+    for s in specs:
+        name, _, weight = s.partition("*")
+        weight = int(weight) if weight else 1
+        if weight <= 0:
+            raise SplitError(f"{name} 的比例必須大於 0")
+        weights[_check_name(name)] = weights.get(name, 0) + weight
+    return _split_by_weight(amount, weights)
+
+
+def _split_by_weight(amount, weights):
+    # 先依比例無條件捨去，剩下的零頭依小數部分大小（同分則依輸入順序）一元一元分配
+    total_weight = sum(weights.values())
+    shares = {}
+    remainders = []
+    for order, (name, weight) in enumerate(weights.items()):
+        share, rem = divmod(amount * weight, total_weight)
+        shares[name] = share
+        remainders.append((-rem, order, name))
+    left = amount - sum(shares.values())
+    for _, _, name in sorted(remainders)[:left]:
+        shares[name] += 1
+    return shares
+
+
+def format_split_note(payer, shares):
+    detail = ",".join(f"{name}={value}" for name, value in shares.items())
+    return f"{SPLIT_TAG} {_check_name(payer)}付 {detail}"
+
+
+def parse_split_note(note):
+    # 不是分帳紀錄時回傳 None
+    note = str(note or "")
+    if not note.startswith(SPLIT_TAG):
+        return None
+    try:
+        payer_part, detail = note[len(SPLIT_TAG):].split()[:2]
+        if not payer_part.endswith("付"):
+            return None
+        shares = {}
+        for pair in detail.split(","):
+            name, value = pair.split("=", 1)
+            shares[name] = int(value)
+        return payer_part[:-1], shares
+    except ValueError:
+        return None
+
+
+class Balances:
+    # 每位成員的淨額：正數代表別人欠他，負數代表他欠別人。
+    # 隨紀錄新增、修改、刪除增減，結算時不需要重新掃描所有分帳紀錄。
+    def __init__(self):
+        self.net = {}
+        self.expenses = 0
+
+    def clear(self):
+        self.net = {}
+        self.expenses = 0
+
+    def _apply(self, record, sign):
+        parsed = parse_split_note(record.get("備註"))
+        if parsed is None:
+            return
+        payer, shares = parsed
+        self.expenses += sign
+        self.net[payer] = self.net.get(payer, 0) + sign * sum(shares.values())
+        for name, value in shares.items():
+            self.net[name] = self.net.get(name, 0) - sign * value
+        for name in [payer, *shares]:
+            if self.net.get(name) == 0:
+                del self.net[name]
+
+    def add(self, record):
+        self._apply(record, 1)
+
+    def remove(self, record):
+        self._apply(record, -1)
+
+    def settle(self):
+        return settle(self.net)
+
+
+def settle(net):
+    # 回傳 [(付款人, 收款人, 金額), ...]。
+    # 找出最少轉帳次數是 NP-hard，這裡用貪婪法：先把金額剛好相等的欠款與債權配對，
+    # 其餘每次讓欠最多的人付給應收最多的人，轉帳次數不超過「有餘額的人數 - 1」，
+    # 時間複雜度 O(n log n)。
+    transfers = []
+    owed_by_amount = {}
+    for name, value in net.items():
+        if value < 0:
+            owed_by_amount.setdefault(-value, []).append(name)
+    matched = set()
+    for name, value in net.items():
+        if value > 0 and owed_by_amount.get(value):
+            debtor = owed_by_amount[value].pop()
+            transfers.append((debtor, name, value))
+            matched.update((debtor, name))
+
+    creditors = [(-value, name) for name, value in net.items() if value > 0 and name not in matched]
+    debtors = [(value, name) for name, value in net.items() if value < 0 and name not in matched]
+    heapq.heapify(creditors)
+    heapq.heapify(debtors)
+    while creditors and debtors:
+        credit, creditor = heapq.heappop(creditors)
+        debt, debtor = heapq.heappop(debtors)
+        pay = min(-credit, -debt)
+        transfers.append((debtor, creditor, pay))
+        if -credit > pay:
+            heapq.heappush(creditors, (credit + pay, creditor))
+        if -debt > pay:
+            heapq.heappush(debtors, (debt + pay, debtor))
+    return transfers
@@ -0,0 +1,132 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+# 對話狀態（例如「修改」流程進行到哪一步）的儲存介面，仿照 Redis 的 get / set(ttl) / delete。
+# 每筆狀態都有存活時間，放著不管的流程會自動過期。
+class StateStore:
+    def __init__(self, ttl=None):
+        if ttl is None:
+            ttl = float(os.getenv("STATE_TTL", "1800"))
+        self.ttl = ttl
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def _expires_at(self, ttl):
+        ttl = self.ttl if ttl is None else ttl
+        return time.time() + ttl if ttl > 0 else float("inf")
+
+
+class MemoryStateStore(StateStore):
+    # 單一程序內使用：LRU，超過 max_entries 時淘汰最久沒用到的狀態
+    def __init__(self, ttl=None, max_entries=None):
+        super().__init__(ttl)
+        if max_entries is None:
+            max_entries = int(os.getenv("STATE_MAX_ENTRIES", "10000"))
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted = 0
+        self.expired = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._data[key]
+                self.expired += 1
+                return None
+            self._data.move_to_end(key)
+            return dict(value)
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (dict(value), self._expires_at(ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evicted += 1
+
+    def delete(self, key):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return dict(entry[0]) if entry else None
+
+    def stats(self):
+        with self._lock:
+            return {"backend": "memory", "size": len(self._data), "evicted": self.evicted, "expired": self.expired}
+
+
+class SQLiteStateStore(StateStore):
+    # 多個 uvicorn worker 共用同一個資料庫檔案，任一 worker 都能接續使用者的流程
+    def __init__(self, path=None, ttl=None):
+        super().__init__(ttl)
+        self.path = path or os.getenv("STATE_SQLITE_PATH", "state.db")
+        self._conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        with self._conn:
+            if self.path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS user_state (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_user_state_expires ON user_state(expires_at)")
+
+    def _purge(self, now):
+        # 每分鐘最多清一次過期資料
+        if now - self._last_purge > 60:
+            self._conn.execute("DELETE FROM user_state WHERE expires_at <= ?", (now,))
+            self._last_purge = now
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM user_state WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO user_state (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), self._expires_at(ttl)),
+            )
+            self._purge(now)
+
+    def delete(self, key):
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT value FROM user_state WHERE key = ?", (key,)).fetchone()
+            self._conn.execute("DELETE FROM user_state WHERE key = ?", (key,))
+        return json.loads(row[0]) if row else None
+
+    def stats(self):
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM user_state WHERE expires_at > ?", (time.time(),)).fetchone()[0]
+        return {"backend": "sqlite", "size": size, "path": self.path}
+
+
+def build_state_store(backend=None):
+    # STATE_BACKEND：memory（預設，單一 worker）或 sqlite（多個 worker 共用）
+    backend = backend or os.getenv("STATE_BACKEND", "memory")
+    if backend == "memory":
+        return MemoryStateStore()
+    if backend == "sqlite":
+        return SQLiteStateStore()
+    raise ValueError(f"未知的 STATE_BACKEND：{backend}")
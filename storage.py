@@ -0,0 +1,652 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from aggregates import amount_of
+from ledger import HEADERS, ID_FIELD, SHEET_HEADERS, parse_id, row_to_record
+from metrics import instrument
+from sheet_writer import SheetWriter, col_letter
+
+logger = logging.getLogger(__name__)
+
+# 沒有分帳本之前的資料（sheet1、舊版 SQLite）屬於這個帳本
+DEFAULT_LEDGER = "default"
+
+
+class RecordNotFound(LookupError):
+    def __init__(self, record_id):
+        super().__init__(f"編號 {record_id} 不存在")
+        self.record_id = record_id
+
+
+def _is_blank(record):
+    return str(record["日期"]).strip() == "" and str(record["項目"]).strip() == ""
+
+
+# 儲存層介面：每筆紀錄以帳本內不重複、不會改變的編號（ID）定位
+class Storage:
+    name = "base"
+
+    def __init__(self):
+        # 新增成功後依寫入順序通知（用來同步更新帳本快取）
+        self.on_append = None
+
+    def _notify(self, rows):
+        if self.on_append:
+            for row in rows:
+                self.on_append(row)
+
+    def load(self):
+        raise NotImplementedError
+
+    def iter_records(self, chunk_size=500):
+        # 逐批讀出所有紀錄（匯出用），預設退回一次載入
+        yield from self.load()
+
+    def append(self, rows):
+        # rows 為 [日期, 項目, 金額, 備註]，可再帶第五欄指定編號（同步、匯入既有資料時）
+        # 回傳每一列的編號
+        raise NotImplementedError
+
+    def update(self, record_id, row):
+        raise NotImplementedError
+
+    def delete(self, record_id):
+        raise NotImplementedError
+
+    def ping(self):
+        # 健康檢查：確認儲存後端連得上，失敗時丟出例外
+        raise NotImplementedError
+
+    def query(self, date=None, month=None):
+        records = self.load()
+        if date is not None:
+            return [r for r in records if str(r["日期"]) == date]
+        if month is not None:
+            return [r for r in records if str(r["日期"]).startswith(month)]
+        return records
+
+    def aggregate(self, start, end):
+        # start、end 為 "YYYY-MM-DD"（含頭尾），回傳 (總金額, {項目: 金額})
+        total = 0
+        per_item = {}
+        for r in self.load():
+            if start <= str(r["日期"]) <= end:
+                amount = amount_of(r)
+                total += amount
+                per_item[r["項目"]] = per_item.get(r["項目"], 0) + amount
+        return total, per_item
+
+    def stats(self):
+        return {"backend": self.name}
+
+
+class SheetStorage(Storage):
+    # 試算表的 E 欄存編號，記憶體中另有「編號 → 列號」對照表，修改、刪除不必搜尋。
+    # 刪除時只清空該列（tombstone），其他列不會位移；累積的空列由背景壓縮一次刪除。
+    # 已配發出去的最大編號記在 F1，壓縮刪掉最後幾列或重新啟動後，編號也不會被重複使用。
+    # 編號以 SHEET_ID_BLOCK 筆為一段向 F1 預留，用完才再讀寫 F1（重新啟動後沒用完的編號會跳過）。
+    # 多個 worker 共用同一張表（WEB_CONCURRENCY > 1，或設定 SHEET_VERIFY_ROWS=1）時，
+    # 修改、刪除前確認該列 E 欄仍是同一筆，別的行程壓縮過而列號位移時重新讀取對照表。
+    name = "sheets"
+    ID_COLUMN = col_letter(len(SHEET_HEADERS))
+    HIGH_WATER_CELL = f"{col_letter(len(SHEET_HEADERS) + 1)}1"
+    # 工作表至少要有的欄數：資料欄加上放 F1 的那一欄
+    COLUMNS = len(SHEET_HEADERS) + 1
+
+    def __init__(self, sheet, batch_ms=None, compact_threshold=None, compact_delay=None, id_block=None, verify_rows=None):
+        super().__init__()
+        if compact_threshold is None:
+            compact_threshold = int(os.getenv("SHEET_COMPACT_THRESHOLD", "50"))
+        if compact_delay is None:
+            compact_delay = float(os.getenv("SHEET_COMPACT_DELAY", "60"))
+        if id_block is None:
+            id_block = int(os.getenv("SHEET_ID_BLOCK", "20"))
+        if verify_rows is None:
+            verify_rows = os.getenv("SHEET_VERIFY_ROWS", "1" if int(os.getenv("WEB_CONCURRENCY", "1")) > 1 else "0") == "1"
+        self.sheet = instrument(sheet, "sheets")
+        self.writer = SheetWriter(self.sheet, batch_ms=batch_ms)
+        self.compact_threshold = compact_threshold
+        self.compact_delay = compact_delay
+        self.id_block = max(1, id_block)
+        self.verify_rows = verify_rows
+        self._row_of = None
+        self._tombstones = []
+        # 下一個要配發的編號，以及這個行程在 F1 預留到的編號
+        self._next_id = 1
+        self._reserved = 0
+        self._has_id_header = False
+        self._grid_checked = False
+        self._map_lock = threading.Lock()
+        # 同一行程內依序配發編號（預留時讀 F1、寫回 F1 之間不能插隊）
+        self._id_lock = threading.Lock()
+        # 一般讀寫可同時進行；壓縮會讓列號位移，必須等進行中的操作都結束才開始
+        self._cond = threading.Condition()
+        self._active = 0
+        self._compacting = False
+        self._timer = None
+        self.compactions = 0
+        self.compacted_rows = 0
+
+    @contextmanager
+    def _op(self):
+        with self._cond:
+            while self._compacting:
+                self._cond.wait()
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify_all()
+
+    def _ensure_grid(self):
+        # 舊版建立的工作表只有資料欄，F1 超出範圍時 API 會回 exceeds grid limits，先補足欄數
+        if self._grid_checked:
+            return
+        cols = getattr(self.sheet, "col_count", None)
+        if cols is not None and cols < self.COLUMNS:
+            self.sheet.add_cols(self.COLUMNS - cols)
+        self._grid_checked = True
+
+    def _read_high_water(self):
+        values = self.sheet.get(self.HIGH_WATER_CELL)
+        return (parse_id(values[0][0]) if values and values[0] else None) or 0
+
+    def _write_high_water(self, high):
+        self.sheet.update(range_name=self.HIGH_WATER_CELL, values=[[high]])
+
+    def _build_index(self, records, schedule=True):
+        # records 與試算表各列一一對應（第 i 筆在第 i + 2 列），回傳未刪除的紀錄
+        row_of = {}
+        tombstones = []
+        missing = []
+        max_id = 0
+        for i, r in enumerate(records):
+            record_id = r[ID_FIELD]
+            if record_id:
+                max_id = max(max_id, record_id)
+            if _is_blank(r):
+                tombstones.append(i + 2)
+            elif record_id is None or record_id in row_of:
+                missing.append(i)
+            else:
+                row_of[record_id] = i + 2
+        self._ensure_grid()
+        stored = self._read_high_water()
+        with self._id_lock, self._map_lock:
+            high = max(self._reserved, max_id, stored)
+            # 舊資料沒有編號：依序補上，並一次寫回整欄
+            for i in missing:
+                high += 1
+                records[i][ID_FIELD] = high
+                row_of[high] = i + 2
+            # 試算表上已有比下一個編號還大的編號（例如匯入時指定）時，從它之後配發
+            self._next_id = max(self._next_id, max_id + 1)
+            self._row_of = row_of
+            self._tombstones = tombstones
+        if missing or not (records or self._has_id_header):
+            column = [[ID_FIELD]] + [[r[ID_FIELD] or ""] for r in records]
+            self.sheet.update(range_name=f"{self.ID_COLUMN}1:{self.ID_COLUMN}{len(column)}", values=column)
+        if high > stored:
+            self._write_high_water(high)
+        self._has_id_header = True
+        if tombstones and schedule:
+            self._schedule_compaction()
+        return [r for r in records if not _is_blank(r)]
+
+    def _load(self, schedule=True):
+        return self._build_index([row_to_record(r.get(h, "") for h in SHEET_HEADERS) for r in self.sheet.get_all_records()], schedule)
+
+    def _ensure_index(self):
+        if self._row_of is None:
+            self._load()
+
+    def _row(self, record_id):
+        # 回傳目前存放該編號的列號；對照表裡沒有（可能是別的行程新增的）就重新讀取一次。
+        # 只有一個行程時對照表一定正確；多個行程時先確認 E 欄仍是這個編號，不符（別的行程壓縮過）也重新讀取
+        for attempt in range(2):
+            with self._map_lock:
+                sheet_row = self._row_of.get(record_id)
+            if sheet_row is not None:
+                if not self.verify_rows:
+                    return sheet_row
+                values = self.sheet.get(f"{self.ID_COLUMN}{sheet_row}")
+                if values and values[0] and parse_id(values[0][0]) == record_id:
+                    return sheet_row
+            if attempt == 0:
+                self._load()
+        raise RecordNotFound(record_id)
+
+    def _reserve(self, first):
+        # 向 F1 預留從 first（或別的行程已配發的編號之後）開始的一段編號；呼叫時須持有 _id_lock。
+        # 試算表沒有原子遞增，讀寫 F1 之間仍有極短的空檔
+        stored = self._read_high_water()
+        self._next_id = max(self._next_id, stored + 1)
+        self._reserved = max(self._next_id, first) + self.id_block - 1
+        self._write_high_water(self._reserved)
+
+    def load(self):
+        with self._op():
+            return self._load()
+
+    def iter_records(self, chunk_size=500):
+        # 以範圍分段讀取，每次只拿 chunk_size 列；已刪除的空列略過
+        start = 2
+        while True:
+            end = start + chunk_size - 1
+            with self._op():
+                rows = self.sheet.get(f"A{start}:{self.ID_COLUMN}{end}")
+            for row in rows:
+                record = row_to_record(row)
+                if not _is_blank(record):
+                    yield record
+            if len(rows) < chunk_size:
+                return
+            start = end + 1
+
+    def append(self, rows):
+        with self._op():
+            self._ensure_index()
+            prepared = []
+            with self._id_lock:
+                # 從預留的編號依序配發；用完或指定的編號超出預留範圍時，先在 F1 記下新的預留再寫入資料列
+                for row in rows:
+                    record = row_to_record(row)
+                    record_id = record[ID_FIELD]
+                    if record_id is None:
+                        if self._next_id > self._reserved:
+                            self._reserve(self._next_id)
+                        record_id = self._next_id
+                    elif record_id > self._reserved:
+                        self._reserve(record_id)
+                    self._next_id = max(self._next_id, record_id + 1)
+                    prepared.append([record[h] for h in HEADERS] + [record_id])
+            sheet_rows = self.writer.append_many(prepared)
+            with self._map_lock:
+                for row, sheet_row in zip(prepared, sheet_rows):
+                    self._row_of[row[-1]] = sheet_row
+        # 離開 _op() 之後才通知快取：快取載入時會呼叫 load() 進入 _op()，
+        # 若壓縮正在等候，持有 _op() 又去拿快取的鎖會互相卡住
+        self._notify(prepared)
+        return [row[-1] for row in prepared]
+
+    def update(self, record_id, row):
+        with self._op():
+            self._ensure_index()
+            self.writer.update_row(self._row(record_id), list(row)[:len(HEADERS)])
+
+    def delete(self, record_id):
+        with self._op():
+            self._ensure_index()
+            sheet_row = self._row(record_id)
+            with self._map_lock:
+                self._row_of.pop(record_id, None)
+            # 只清空資料欄、保留編號，編號不會被之後的新增重複使用
+            self.writer.update_row(sheet_row, [""] * len(HEADERS))
+            with self._map_lock:
+                self._tombstones.append(sheet_row)
+        self._schedule_compaction()
+
+    def _schedule_compaction(self):
+        with self._map_lock:
+            pending = len(self._tombstones)
+            if not pending:
+                return
+            if pending >= self.compact_threshold or self.compact_delay <= 0:
+                delay = 0
+            elif self._timer is None:
+                delay = self.compact_delay
+            else:
+                return
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(delay, self.compact)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def compact(self):
+        # 刪除所有 tombstone 列，並依刪掉的列數平移對照表中的列號
+        with self._cond:
+            while self._compacting:
+                self._cond.wait()
+            self._compacting = True
+            while self._active:
+                self._cond.wait()
+        try:
+            with self._map_lock:
+                self._timer = None
+            # 以試算表目前的內容決定要刪哪些空列（其他 worker 可能已新增、刪除或壓縮過）
+            self._load(schedule=False)
+            with self._map_lock:
+                rows = sorted(set(self._tombstones))
+                self._tombstones = []
+            if not rows:
+                return 0
+            try:
+                # 由下往上刪，連續的列一次刪除
+                for first, last in reversed(_runs(rows)):
+                    self.sheet.delete_rows(first, last)
+            except Exception:
+                # 刪到一半失敗時列號已不可靠，下次使用時重新讀取整張表
+                with self._map_lock:
+                    self._row_of = None
+                logger.exception("壓縮試算表失敗")
+                raise
+            with self._map_lock:
+                if self._row_of is not None:
+                    self._row_of = {rid: r - bisect_left(rows, r) for rid, r in self._row_of.items()}
+            self.compactions += 1
+            self.compacted_rows += len(rows)
+            return len(rows)
+        finally:
+            with self._cond:
+                self._compacting = False
+                self._cond.notify_all()
+
+    def ping(self):
+        self.sheet.get("A1:A1")
+
+    def stats(self):
+        return {
+            "backend": self.name,
+            **self.writer.stats(),
+            "tombstones": len(self._tombstones),
+            "compactions": self.compactions,
+            "compacted_rows": self.compacted_rows,
+        }
+
+
+def _runs(rows):
+    # [2, 3, 4, 7, 9, 10] → [(2, 4), (7, 7), (9, 10)]
+    runs = []
+    for r in rows:
+        if runs and runs[-1][1] == r - 1:
+            runs[-1] = (runs[-1][0], r)
+        else:
+            runs.append((r, r))
+    return runs
+
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+def _open_database(path):
+    # 同一個資料庫檔案的所有分區共用一條連線與一把鎖
+    with _databases_lock:
+        if path not in _databases:
+            conn = sqlite3.connect(path, check_same_thread=False)
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS expenses ("
+                    "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                    "date TEXT NOT NULL, item TEXT NOT NULL, amount INTEGER NOT NULL, note TEXT NOT NULL DEFAULT '')"
+                )
+                columns = [row[1] for row in conn.execute("PRAGMA table_info(expenses)")]
+                if "ledger" not in columns:
+                    # 舊版資料庫沒有分區欄位，既有資料歸到預設帳本
+                    conn.execute(f"ALTER TABLE expenses ADD COLUMN ledger TEXT NOT NULL DEFAULT '{DEFAULT_LEDGER}'")
+                if "rid" not in columns:
+                    # 帳本內的紀錄編號，既有資料依寫入順序編號
+                    conn.execute("ALTER TABLE expenses ADD COLUMN rid INTEGER")
+                    conn.execute(
+                        "UPDATE expenses SET rid = (SELECT COUNT(*) FROM expenses AS e "
+                        "WHERE e.ledger = expenses.ledger AND e.id <= expenses.id)"
+                    )
+                conn.execute("DROP INDEX IF EXISTS idx_expenses_date")
+                conn.execute("DROP INDEX IF EXISTS idx_expenses_item")
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_expenses_ledger_date ON expenses(ledger, date)")
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_expenses_ledger_item ON expenses(ledger, item)")
+                conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_expenses_ledger_rid ON expenses(ledger, rid)")
+                # 各帳本用過的最大編號；刪掉最後一筆後，編號也不會再配給新紀錄
+                conn.execute("CREATE TABLE IF NOT EXISTS ledger_sequences (ledger TEXT PRIMARY KEY, last_rid INTEGER NOT NULL)")
+                conn.execute(
+                    "INSERT OR IGNORE INTO ledger_sequences (ledger, last_rid) "
+                    "SELECT ledger, MAX(rid) FROM expenses GROUP BY ledger"
+                )
+            _databases[path] = (conn, threading.Lock())
+        return _databases[path]
+
+
+class SQLiteStorage(Storage):
+    # 每個帳本是 expenses 表中的一個分區（ledger 欄位）
+    name = "sqlite"
+
+    def __init__(self, path=None, ledger_id=None):
+        super().__init__()
+        self.path = path or os.getenv("SQLITE_PATH", "ledger.db")
+        self.ledger_id = ledger_id or DEFAULT_LEDGER
+        self._conn, self._lock = _open_database(self.path)
+        # 新增與通知快取必須依同一順序進行，但通知時不能握著 _lock（快取載入也需要 _lock）
+        self._append_lock = threading.Lock()
+
+    @staticmethod
+    def _to_record(row):
+        return dict(zip(SHEET_HEADERS, row))
+
+    def _count(self):
+        return self._conn.execute("SELECT COUNT(*) FROM expenses WHERE ledger = ?", (self.ledger_id,)).fetchone()[0]
+
+    def count(self):
+        with self._lock:
+            return self._count()
+
+    def load(self):
+        with self._lock:
+            cur = self._conn.execute(
+                "SELECT date, item, amount, note, rid FROM expenses WHERE ledger = ? ORDER BY id", (self.ledger_id,)
+            )
+            return [self._to_record(row) for row in cur]
+
+    def iter_records(self, chunk_size=500):
+        # 以 id 分頁，每批只在讀取時持有鎖，匯出期間不會擋住其他寫入
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, date, item, amount, note, rid FROM expenses WHERE ledger = ? AND id > ? ORDER BY id LIMIT ?",
+                    (self.ledger_id, last_id, chunk_size),
+                ).fetchall()
+            for row in rows:
+                yield self._to_record(row[1:])
+            if len(rows) < chunk_size:
+                return
+            last_id = rows[-1][0]
+
+    def append(self, rows):
+        rows = [row_to_record(row) for row in rows]
+        with self._append_lock:
+            with self._lock, self._conn:
+                # 先寫序號表，交易一開始就取得寫入鎖，其他行程同時新增時不會拿到相同的編號
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO ledger_sequences (ledger, last_rid) VALUES (?, 0)", (self.ledger_id,)
+                )
+                high = self._conn.execute(
+                    "SELECT MAX(last_rid, (SELECT COALESCE(MAX(rid), 0) FROM expenses WHERE ledger = ?)) "
+                    "FROM ledger_sequences WHERE ledger = ?",
+                    (self.ledger_id, self.ledger_id),
+                ).fetchone()[0]
+                for r in rows:
+                    if not r[ID_FIELD]:
+                        r[ID_FIELD] = high + 1
+                    high = max(high, r[ID_FIELD])
+                self._conn.executemany(
+                    "INSERT INTO expenses (ledger, rid, date, item, amount, note) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(self.ledger_id, r[ID_FIELD], str(r["日期"]), str(r["項目"]), amount_of(r), str(r["備註"])) for r in rows],
+                )
+                self._conn.execute("UPDATE ledger_sequences SET last_rid = ? WHERE ledger = ?", (high, self.ledger_id))
+            self._notify([[r[h] for h in SHEET_HEADERS] for r in rows])
+        return [r[ID_FIELD] for r in rows]
+
+    # SQLite 刪除不會讓其他紀錄位移，直接以 (ledger, rid) 索引定位
+    def update(self, record_id, row):
+        r = row_to_record(row)
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "UPDATE expenses SET date = ?, item = ?, amount = ?, note = ? WHERE ledger = ? AND rid = ?",
+                (str(r["日期"]), str(r["項目"]), amount_of(r), str(r["備註"]), self.ledger_id, record_id),
+            )
+        if cur.rowcount == 0:
+            raise RecordNotFound(record_id)
+
+    def delete(self, record_id):
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "DELETE FROM expenses WHERE ledger = ? AND rid = ?", (self.ledger_id, record_id)
+            )
+        if cur.rowcount == 0:
+            raise RecordNotFound(record_id)
+
+    def ping(self):
+        with self._lock:
+            self._conn.execute("SELECT 1").fetchone()
+
+    def query(self, date=None, month=None):
+        sql = "SELECT date, item, amount, note, rid FROM expenses WHERE ledger = ?"
+        args = (self.ledger_id,)
+        if date is not None:
+            sql, args = sql + " AND date = ?", args + (date,)
+        elif month is not None:
+            # 以範圍查詢才能用到 (ledger, date) 索引
+            sql, args = sql + " AND date >= ? AND date < ?", args + (f"{month}-01", f"{month}-32")
+        with self._lock:
+            return [self._to_record(row) for row in self._conn.execute(sql + " ORDER BY id", args)]
+
+    def aggregate(self, start, end):
+        with self._lock:
+            cur = self._conn.execute(
+                "SELECT item, SUM(amount) FROM expenses WHERE ledger = ? AND date >= ? AND date <= ? "
+                "GROUP BY item ORDER BY MIN(id)",
+                (self.ledger_id, start, end),
+            )
+            per_item = {item: total for item, total in cur}
+        return sum(per_item.values()), per_item
+
+    def stats(self):
+        return {"backend": self.name, "path": self.path, "ledger": self.ledger_id}
+
+
+class SheetMirror:
+    # 所有帳本共用的背景同步執行緒，依序把 SQLite 的寫入重播到各自的工作表
+    def __init__(self):
+        self._queue = queue.Queue()
+        self.mirrored = 0
+        self.errors = 0
+        self._thread = threading.Thread(target=self._run, name="sheet-mirror", daemon=True)
+        self._thread.start()
+
+    def put(self, target, op, *args):
+        self._queue.put((target, op, args))
+
+    def _run(self):
+        while True:
+            target, op, args = self._queue.get()
+            try:
+                getattr(target, op)(*args)
+                self.mirrored += 1
+            except Exception:
+                self.errors += 1
+                logger.exception("同步到 Google Sheet 失敗：%s", op)
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        self._queue.join()
+
+    def stats(self):
+        return {"mirror_pending": self._queue.qsize(), "mirrored": self.mirrored, "mirror_errors": self.errors}
+
+
+class MirroredStorage(Storage):
+    # SQLite 為主要儲存，寫入後再由背景執行緒依序同步到 Google Sheet。
+    # 兩邊使用相同的紀錄編號，修改、刪除可以直接對應。
+    name = "sqlite+sheets"
+
+    def __init__(self, primary, mirror, worker):
+        super().__init__()
+        self.primary = primary
+        self.mirror = mirror
+        self.worker = worker
+        # 主儲存寫入與排入同步佇列必須是同一順序
+        self._order_lock = threading.Lock()
+        if primary.count() == 0:
+            # 第一次啟用時從試算表匯入既有資料
+            # 沿用試算表上的編號，兩邊的編號才會一致
+            rows = [[r[h] for h in SHEET_HEADERS] for r in mirror.load()]
+            if rows:
+                primary.append(rows)
+        self.primary.on_append = lambda row: self._notify([row])
+
+    def load(self):
+        return self.primary.load()
+
+    def iter_records(self, chunk_size=500):
+        return self.primary.iter_records(chunk_size)
+
+    def append(self, rows):
+        with self._order_lock:
+            ids = self.primary.append(rows)
+            # 試算表寫入與主儲存相同的編號
+            rows = [list(row)[:len(HEADERS)] + [record_id] for row, record_id in zip(rows, ids)]
+            self.worker.put(self.mirror, "append", rows)
+        return ids
+
+    def update(self, record_id, row):
+        with self._order_lock:
+            self.primary.update(record_id, row)
+            self.worker.put(self.mirror, "update", record_id, row)
+
+    def delete(self, record_id):
+        with self._order_lock:
+            self.primary.delete(record_id)
+            self.worker.put(self.mirror, "delete", record_id)
+
+    def ping(self):
+        self.primary.ping()
+        self.mirror.ping()
+
+    def query(self, date=None, month=None):
+        return self.primary.query(date=date, month=month)
+
+    def aggregate(self, start, end):
+        return self.primary.aggregate(start, end)
+
+    def flush(self):
+        self.worker.flush()
+
+    def stats(self):
+        return {"backend": self.name, "ledger": self.primary.ledger_id, **self.worker.stats()}
+
+
+_mirror_worker = None
+_mirror_worker_lock = threading.Lock()
+
+
+def _get_mirror_worker():
+    global _mirror_worker
+    with _mirror_worker_lock:
+        if _mirror_worker is None:
+            _mirror_worker = SheetMirror()
+        return _mirror_worker
+
+
+def build_storage(open_worksheet, ledger_id=None, backend=None):
+    # LEDGER_BACKEND：sheets（預設）、sqlite、sqlite+sheets
+    # open_worksheet(ledger_id) 回傳該帳本的工作表（只有用到試算表時才會呼叫）
+    ledger_id = ledger_id or DEFAULT_LEDGER
+    backend = backend or os.getenv("LEDGER_BACKEND", "sheets")
+    if backend == "sheets":
+        return SheetStorage(open_worksheet(ledger_id))
+    if backend == "sqlite":
+        return SQLiteStorage(ledger_id=ledger_id)
+    if backend == "sqlite+sheets":
+        return MirroredStorage(
+            SQLiteStorage(ledger_id=ledger_id), SheetStorage(open_worksheet(ledger_id)), _get_mirror_worker()
+        )
+    raise ValueError(f"未知的 LEDGER_BACKEND：{backend}")
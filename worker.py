@@ -0,0 +1,98 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class EventDispatcher:
+    # Webhook 事件的背景處理：/callback 驗證簽章後把事件丟進來就立即回 200，
+    # 由執行緒池處理。同一個 key（使用者）的事件依序執行，不同使用者可並行，
+    # 這樣 user_state 的對話步驟才不會亂序。
+    def __init__(self, handle, max_workers=None, max_pending=None):
+        if max_workers is None:
+            max_workers = int(os.getenv("WEBHOOK_WORKERS", "8"))
+        if max_pending is None:
+            max_pending = int(os.getenv("WEBHOOK_QUEUE_LIMIT", "1000"))
+        self._handle = handle
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="webhook")
+        self.max_pending = max_pending
+        self._queues = {}
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._wait_total = 0.0
+        self._run_total = 0.0
+        self.max_latency = 0.0
+
+    def submit(self, key, event):
+        return self.submit_many([(key, event)])
+
+    def submit_many(self, items):
+        # items 為 [(key, event), ...]；整批放得下才全部收下，否則一筆都不收，
+        # LINE 重送時才不會讓前面已收下的事件重複處理
+        started = []
+        with self._lock:
+            if self.pending + len(items) > self.max_pending:
+                self.rejected += len(items)
+                return False
+            now = time.monotonic()
+            for key, event in items:
+                self.pending += 1
+                queue = self._queues.get(key)
+                if queue is not None:
+                    # 這個使用者已有事件在處理，排在後面即可
+                    queue.append((event, now))
+                    continue
+                self._queues[key] = deque([(event, now)])
+                started.append(key)
+        for key in started:
+            self._executor.submit(self._drain, key)
+        return True
+
+    def _drain(self, key):
+        while True:
+            with self._lock:
+                queue = self._queues[key]
+                if not queue:
+                    del self._queues[key]
+                    return
+                event, queued_at = queue.popleft()
+            started = time.monotonic()
+            ok = True
+            try:
+                self._handle(event)
+            except Exception:
+                ok = False
+                logger.exception("處理 webhook 事件失敗")
+            finished = time.monotonic()
+            with self._lock:
+                self.pending -= 1
+                self.processed += 1
+                if not ok:
+                    self.failed += 1
+                self._wait_total += started - queued_at
+                self._run_total += finished - started
+                self.max_latency = max(self.max_latency, finished - queued_at)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def stats(self):
+        with self._lock:
+            done = self.processed or 1
+            return {
+                "queue_depth": self.pending,
+                "active_users": len(self._queues),
+                "processed": self.processed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "avg_wait_ms": round(self._wait_total / done * 1000, 1),
+                "avg_process_ms": round(self._run_total / done * 1000, 1),
+                "max_latency_ms": round(self.max_latency * 1000, 1),
+            }